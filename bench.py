@@ -0,0 +1,427 @@
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import pathlib
+import platform
+import random
+import subprocess
+import tempfile
+import sys
+import time
+import timeit
+import tracemalloc
+
+import terucost
+
+
+def best_of(fn, number: int, repeat: int) -> float:
+    # seconds per call, best of `repeat` runs of `number` calls
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def synthetic_recipes(n: int, width: int = 4, depth: int = None, seed: int = 0) -> dict:
+    """
+    n items in `depth` layers (by default about sqrt(n)). each item is crafted from up to `width` ingredients from
+    the layer below, raw materials for the first layer, so every item sits on top of a `depth` long chain of crafts.
+    """
+    rng = random.Random(seed)
+    depth = depth or max(1, round(n ** .5))
+    below = list(terucost.COSTS)
+    recipes = {}
+    for layer in range(depth):
+        names = [f'item_{i}' for i in range(n * layer // depth, n * (layer + 1) // depth)]
+        for name in names:
+            ingredients = {rng.choice(below): rng.randint(1, 9) for _ in range(width)}
+            recipes[name] = terucost.Recipe(ingredients, rng.choice((1, 1, 2, 3, 4, 9)))
+
+        below = names or below
+
+    return recipes
+
+
+def sample_components(name: str):
+    costs = terucost.make_costs(exact=name == 'exact')
+    graph = terucost.RecipeGraph(costs=costs, components=terucost.COMPONENTS[name])
+    return graph, costs
+
+
+def bench_startup(args):
+    print('cold start, in a new interpreter')
+    results = {}
+    for name, code in (
+        ('python', 'pass'),
+        ('import terucost', 'import terucost'),
+        ('first item lookup', 'import terucost; terucost.items["thermese_heater"]'),
+        ('build the whole graph', 'import terucost; terucost.RecipeGraph()'),
+    ):
+        t = best_of(lambda: subprocess.run([sys.executable, '-c', code], check=True), 1, args.repeat)
+        results[name] = t
+        print(f'    {name:28}{t * 1e3:12.1f} ms')
+
+    return results
+
+
+def bench_ops(args):
+    print('Components arithmetic')
+    results = {}
+    for name in terucost.COMPONENTS:
+        graph, costs = sample_components(name)
+        a = graph.components['thermese_heater']
+        b = graph.components['upgrade_base']
+        for op, fn in (('*', lambda: a * 3), ('/', lambda: a / 3), ('+', lambda: a + b)):
+            t = best_of(fn, args.number * 100, args.repeat)
+            results[f'{name} {op}'] = t
+            print(f'    {name:10}{op:18}{t * 1e6:12.2f} us')
+
+    return results
+
+
+def bench_cost_of(args):
+    print('cost_of, every catalogue item')
+    results = {}
+    for name in terucost.COMPONENTS:
+        graph, costs = sample_components(name)
+        values = list(graph.components.values())
+        for label, round_up in (('', None), ('round_up=.25', .25)):
+            def price():
+                for c in values:
+                    terucost.cost_of(c, args.markup, round_up, costs)
+
+            t = best_of(price, args.number, args.repeat) / len(values)
+            results[f'{name} {label}'.strip()] = t
+            print(f'    {name:10}{label:18}{t * 1e6:12.2f} us')
+
+    return results
+
+
+def bench_main(args):
+    print('main(), whole price list')
+    results = {}
+    for name in terucost.COMPONENTS:
+        main_args = terucost.parse_args(['--components', name])
+
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                terucost.main(main_args)
+
+        t = best_of(run, max(1, args.number // 10), args.repeat)
+        results[name] = t
+        print(f'    {name:28}{t * 1e3:12.2f} ms')
+
+    return results
+
+
+def bench_catalogue(args):
+    results = {}
+    for n in args.sizes:
+        recipes = synthetic_recipes(n, args.width, args.depth)
+        print(f'{n} item synthetic catalogue, width {args.width}, depth {args.depth or max(1, round(n ** .5))}')
+        number = max(1, args.number * 100 // n)
+        # every variant builds the graph and prices the whole catalogue, so the rates are comparable
+        for name in ('counter', 'compact', 'matrix'):
+            if name == 'matrix':
+                if terucost.np is None:
+                    continue
+
+                def price_all():
+                    terucost.MaterialMatrix(terucost.RecipeGraph(recipes)).price_all(args.markup, 1)
+
+            else:
+                def price_all():
+                    terucost.RecipeGraph(recipes, components=terucost.COMPONENTS[name]).price_all(args.markup, 1)
+
+            t = best_of(price_all, number, args.repeat)
+            results[f'{n} {name}'] = t
+            print(f'    {name:28}{t * 1e3:12.2f} ms {n / t:12.0f} items/s')
+
+    return results
+
+
+def bench_incremental(args):
+    graph = terucost.RecipeGraph()
+    session = terucost.PricingSession(graph, args.markup)
+    ore = args.material
+    # alternate between two prices so that every call really changes something
+    next_price = itertools.cycle([terucost.COSTS[ore] * 1.01, terucost.COSTS[ore]]).__next__
+
+    def full():
+        costs = dict(terucost.COSTS, **{ore: next_price()})
+        terucost.RecipeGraph(costs=costs).price_all(args.markup)
+
+    def reprice():
+        costs = dict(terucost.COSTS, **{ore: next_price()})
+        for c in graph.components.values():
+            terucost.cost_of(c, args.markup, costs=costs)
+
+    def incremental():
+        session.update(**{ore: next_price()})
+
+    print(f'one {ore} price change, {len(graph.order)} items, {len(session.uses[ore])} affected')
+    results = {}
+    full_time = best_of(full, args.number, args.repeat)
+    for name, fn in (
+        ('rebuild graph + price_all', full),
+        ('reprice cached components', reprice),
+        ('PricingSession.update', incremental),
+    ):
+        t = best_of(fn, args.number, args.repeat)
+        results[name] = t
+        print(f'    {name:28}{t * 1e6:12.1f} us {full_time / t:10.1f}x')
+
+    return results
+
+
+def bench_sensitivity(args):
+    graph = terucost.RecipeGraph(synthetic_recipes(args.items, args.width, args.depth))
+    ore = args.material
+    start = time.perf_counter()
+    uses = graph.reverse_index()[ore]
+    build = time.perf_counter() - start
+    print(f'{ore} sensitivity, {len(graph.order)} item synthetic catalogue, {len(uses)} items contain it')
+    print(f'    {"build index":28}{build * 1e3:12.3f} ms')
+    results = dict(build=build)
+    for name, fn in (
+        ('sensitivity', lambda: graph.sensitivity(ore, args.markup)),
+        ('most_sensitive, top 10', lambda: graph.most_sensitive(ore, 10, args.markup)),
+    ):
+        t = best_of(fn, args.number, args.repeat)
+        results[name] = t
+        print(f'    {name:28}{t * 1e3:12.3f} ms')
+
+    return results
+
+
+def bench_routes(args):
+    # every synthetic item gets a second recipe from another seed, with the same layering so there are no cycles
+    recipes = synthetic_recipes(args.items, args.width, args.depth)
+    other = synthetic_recipes(args.items, args.width, args.depth, seed=1)
+    alternatives = {item: (recipe, other[item]) for item, recipe in recipes.items()}
+    print(f'cheapest routes, {len(recipes)} item synthetic catalogue, 2 recipes each')
+    routes = terucost.cheapest_routes(recipes, alternatives, terucost.COSTS)
+    t = best_of(lambda: terucost.cheapest_routes(recipes, alternatives, terucost.COSTS), 1, args.repeat)
+    changed = sum(route.choice != 0 for route in routes.values())
+    print(f'    {"cheapest_routes":28}{t * 1e3:12.2f} ms {len(recipes) / t:12.0f} items/s   {changed} changed')
+    return dict(cheapest_routes=t, changed=changed)
+
+
+def bench_export(args):
+    prices = terucost.RecipeGraph(synthetic_recipes(args.items, args.width, args.depth)).price_all(args.markup, 1)
+    keys = list(prices)
+    print(f'load exported prices and look one up, {len(prices)} prices')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = pathlib.Path(tmp, 'prices.json')
+        price_path = pathlib.Path(tmp, 'prices.prices')
+        terucost.write_json(json_path, prices)
+        terucost.write_price_file(price_path, prices)
+
+        def load_json():
+            with json_path.open() as fh:
+                return json.load(fh)[keys[-1]]
+
+        def load_price_file():
+            with terucost.PriceFile(price_path) as table:
+                return table[keys[-1]]
+
+        for name, fn in (('json', load_json), ('price file', load_price_file)):
+            t = best_of(fn, args.number, args.repeat)
+            results[name] = t
+            print(f'    {name:28}{t * 1e6:12.1f} us')
+
+    return results
+
+
+def bench_history(args):
+    graph = terucost.RecipeGraph(synthetic_recipes(args.items, args.width, args.depth))
+    session = terucost.PricingSession(graph)
+    rng = random.Random(0)
+    print(f'price history, {args.snapshots} snapshots of {len(session.base)} prices')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp, 'prices.history')
+        history = terucost.PriceHistory(path)
+        append = 0.0
+        for _ in range(args.snapshots):
+            session.update(**{material: cost * rng.uniform(.9, 1.1) for material, cost in terucost.COSTS.items()})
+            start = time.perf_counter()
+            history.append(session.base)
+            append += time.perf_counter() - start
+
+        results['append'] = append / args.snapshots
+        results['bytes per snapshot'] = path.stat().st_size / args.snapshots
+        results['open'] = best_of(lambda: terucost.PriceHistory(path), 1, args.repeat)
+        results['diff'] = best_of(lambda: terucost.diff_snapshots(history, 0, -1, 20), 1, args.repeat)
+
+    for name, value in results.items():
+        unit = 'B' if name.startswith('bytes') else 'ms'
+        print(f'    {name:28}{value * (1 if unit == "B" else 1e3):12.2f} {unit}')
+
+    return results
+
+
+def bench_policy(args):
+    # markup and rounding for every item of a synthetic catalogue, one rule at a time or as masked arrays
+    graph = terucost.RecipeGraph(synthetic_recipes(args.items, args.width, args.depth))
+    items = list(graph.order)
+    policy = terucost.PricingPolicy(
+        terucost.PricingRule(frozenset(items[i::args.rules]), round_up=.25 * (i + 1)) for i in range(args.rules)
+    )
+    print(f'pricing policy, {len(items)} item synthetic catalogue, {args.rules} rules')
+    results = {}
+    for name, fn in (
+        ('settings, per item', lambda: [policy.settings(item, 1, args.markup, 1) for item in items]),
+        ('arrays', lambda: policy.arrays(items, 1, args.markup, 1)),
+        ('price_items', lambda: terucost.price_items(graph, args.markup, 1, policy)),
+    ):
+        t = best_of(fn, args.number, args.repeat)
+        results[name] = t
+        print(f'    {name:28}{t * 1e3:12.3f} ms')
+
+    return results
+
+
+def bench_lazy(args):
+    results = {}
+    synthetic = synthetic_recipes(args.items, args.width, args.depth)
+    for label, recipes, item in (('catalogue', terucost.RECIPES, args.item),
+                                 (f'{args.items} item synthetic catalogue', synthetic, f'item_{args.items - 1}')):
+        subtree = terucost.LazyRecipeGraph(recipes)
+        subtree.price(item)
+        print(f'one {item} price, {label}, {len(subtree.components.expanded)} of {len(recipes)} items expanded')
+        number = max(1, args.number * len(terucost.RECIPES) // len(recipes))
+        for name, graph_type in (('eager', terucost.RecipeGraph), ('lazy', terucost.LazyRecipeGraph)):
+            def price():
+                graph_type(recipes).price(item, 1, args.markup, 1)
+
+            t = best_of(price, number, args.repeat)
+            results[f'{len(recipes)} {name}'] = t
+            print(f'    {name:28}{t * 1e3:12.3f} ms')
+
+    return results
+
+
+def bench_memory(args):
+    recipes = synthetic_recipes(args.items, args.width, args.depth)
+    counters = list(terucost.RecipeGraph(recipes).components.values())
+    print(f'components memory, {len(counters)} item synthetic catalogue')
+    results = {}
+    for name in ('counter', 'compact'):
+        components_type = terucost.COMPONENTS[name]
+        start = time.perf_counter()
+        terucost.RecipeGraph(recipes, components=components_type)
+        build = time.perf_counter() - start
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        values = [components_type(c) for c in counters]
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del values
+
+        results[name] = dict(bytes=size, build=build)
+        print(f'    {name:28}{size / 2 ** 20:9.2f} MiB {size / len(counters):8.0f} B/item   build {build * 1e3:8.1f} ms')
+
+    return results
+
+
+def bench_exact(args):
+    exact_costs = terucost.make_costs(exact=True)
+    results = {}
+    for label, recipes in (('catalogue', terucost.RECIPES), (f'{args.items} item synthetic catalogue', None)):
+        if recipes is None:
+            recipes = synthetic_recipes(args.items, args.width, args.depth)
+
+        number = max(1, args.number * len(terucost.RECIPES) // len(recipes))
+        print(f'float vs exact, {label}')
+        for name, costs in (('counter', terucost.COSTS), ('exact', exact_costs)):
+            def price_all():
+                terucost.RecipeGraph(recipes, costs, terucost.COMPONENTS[name]).price_all(args.markup, 1)
+
+            t = best_of(price_all, number, args.repeat)
+            results[f'{len(recipes)} {name}'] = t
+            print(f'    {name:28}{t * 1e3:12.2f} ms {len(recipes) / t:12.0f} items/s')
+
+    return results
+
+
+def bench_check(args):
+    # the default price list should still match costs.table
+    main_args = terucost.parse_args([])
+    table = terucost.price_table(terucost.CATALOGUE.graph(), terucost.PRICE_LIST, main_args.markup, main_args.roundup,
+                                 policy=terucost.CATALOGUE.policy)
+    current = [row for section in table for row in section]
+    changes = terucost.compare_prices(terucost.read_price_table(terucost.GOLDEN_PATH), current)
+    print(f'price list vs {terucost.GOLDEN_PATH.name}: {len(changes)} of {len(current)} prices changed')
+    for label, old, new in changes:
+        print(f'    {label:20} {old} -> {new}')
+
+    return dict(ok=not changes, changes=changes)
+
+
+BENCHMARKS = dict(
+    check=bench_check,
+    startup=bench_startup,
+    ops=bench_ops,
+    cost_of=bench_cost_of,
+    main=bench_main,
+    catalogue=bench_catalogue,
+    incremental=bench_incremental,
+    sensitivity=bench_sensitivity,
+    policy=bench_policy,
+    lazy=bench_lazy,
+    routes=bench_routes,
+    export=bench_export,
+    history=bench_history,
+    memory=bench_memory,
+    exact=bench_exact,
+)
+
+
+def main(args):
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        results[name] = BENCHMARKS[name](args)
+
+    if args.json:
+        with args.json.open('w') as fh:
+            json.dump(dict(
+                timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                python=platform.python_version(),
+                args={key: value for key, value in vars(args).items() if key != 'json'},
+                results=results,
+            ), fh, indent=2)
+
+    if 'check' in results and not results['check']['ok']:
+        sys.exit(1)
+
+
+def parse_args(argv=None, namespace=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f'one of {", ".join(BENCHMARKS)}; default: all')
+    parser.add_argument('--json', type=pathlib.Path, help='also save the results here')
+    parser.add_argument('--markup', '-m', type=float, default=(1/4), help='default: %(default)s')
+    parser.add_argument('--item', default='teleporter', help='default: %(default)s')
+    parser.add_argument('--material', default='mithril_ingot', help='default: %(default)s')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 10_000],
+                        help='synthetic catalogue sizes; default: %(default)s')
+    parser.add_argument('--items', type=int, default=10_000, help='synthetic catalogue size; default: %(default)s')
+    parser.add_argument('--snapshots', type=int, default=100, help='price history length; default: %(default)s')
+    parser.add_argument('--rules', type=int, default=10, help='synthetic pricing policy size; default: %(default)s')
+    parser.add_argument('--width', type=int, default=4, help='ingredients per synthetic recipe; default: %(default)s')
+    parser.add_argument('--depth', type=int, help='synthetic recipe chain length; default: sqrt of the size')
+    parser.add_argument('--number', '-n', type=int, default=100, help='default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=5, help='default: %(default)s')
+    args = parser.parse_args(argv, namespace)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name!r}')
+
+    return args
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -1,45 +1,84 @@
-import argparse
+import array
 import collections
+import collections.abc
+import contextlib
+import fractions
+import functools
+import heapq
+import importlib
+import importlib.util
+import itertools
+import json
 import math
+import mmap
+import operator
+import os
+import pathlib
+import pickle
+import signal
+import struct
+import sys
+import time
+import typing
+import weakref
 
-# cost, in mg, of various raw materials
-_COST_SCALE = 1
-_DENOMINATOR = 744.65  # gold lump sieve rarity
-_CRYSTAL_SCALE = 3
-
-COSTS = dict(
-    stone=1/99,
-    gravel=1/99,
-    sand=1/99,
-    silver_sand=5/99,
-    clay=1/99,
-    dirt=5/99,
-    tree=1/99,
-    cotton=10/99,
-    obsidian=1/99,
-    flint=16 / 5,
-    water=1,
-    flower=1,
-    sapling=1,
-
-    # scaled by what comes out of the gravel sieve
-    coal=(96.06/_DENOMINATOR)*_COST_SCALE,
-    steel_ingot=(99.90/_DENOMINATOR)*_COST_SCALE,
-    terumetal_ingot=(199.79/_DENOMINATOR)*_COST_SCALE,
-    copper_ingot=(244.05 / _DENOMINATOR) * _COST_SCALE,
-    quartz=(277.84 / _DENOMINATOR)*_COST_SCALE*_CRYSTAL_SCALE,
-    lead_ingot=(288.89 / _DENOMINATOR) * _COST_SCALE,
-    tin_ingot=(334.75/_DENOMINATOR)*_COST_SCALE,
-    zinc_ingot=(360.23 / _DENOMINATOR) * _COST_SCALE,
-    silver_ingot=(554.65/_DENOMINATOR) * _COST_SCALE,
-    gold_ingot=(744.65/_DENOMINATOR)*_COST_SCALE,
-    uranium_ingot=(930.01/_DENOMINATOR)*_COST_SCALE,
-    mese=(948.07/_DENOMINATOR)*_COST_SCALE*_CRYSTAL_SCALE,
-    diamond=(1486.28/_DENOMINATOR)*_COST_SCALE*_CRYSTAL_SCALE,
-    chromium_ingot=(1994.82/_DENOMINATOR)*_COST_SCALE,
-    mithril_ingot=(2264.81/_DENOMINATOR)*_COST_SCALE,
-    titanium=(2905.08/_DENOMINATOR)*_COST_SCALE*_CRYSTAL_SCALE,
-)
+if typing.TYPE_CHECKING:
+    import asyncio
+
+
+class _Deferred:
+    # stands in for an optional module until one of its attributes is first used, then imports it the ordinary way
+    # and takes its place here. `import terucost` doesn't pay for it, and nothing outside sees anything but the module
+    def __init__(self, name: str, alias: str):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+
+np = _Deferred('numpy', 'np') if importlib.util.find_spec('numpy') else None
+
+CATALOGUE_PATH = pathlib.Path(__file__).with_name('terucost.toml')
+GOLDEN_PATH = pathlib.Path(__file__).with_name('costs.table')
+HISTORY_PATH = pathlib.Path(__file__).with_name('terucost.history')
+_CACHE_VERSION = 4
+
+
+def exact_number(x) -> fractions.Fraction:
+    # floats are taken as written, so 744.65 becomes 74465/100 rather than its binary approximation
+    if isinstance(x, float):
+        return fractions.Fraction(repr(x))
+
+    return fractions.Fraction(x)
+
+
+def make_costs(denominator: float = None, cost_scale: float = None, crystal_scale: float = None,
+               exact: bool = False, spec: dict = None) -> dict:
+    # raw material prices from the [costs] table of a catalogue; the keyword arguments override its settings.
+    # with exact=True every price is a Fraction, e.g. Fraction(1, 99) rather than the nearest float
+    spec = default_catalogue().cost_spec if spec is None else spec
+    n = exact_number if exact else float
+    denominator = n(spec['denominator'] if denominator is None else denominator)
+    cost_scale = n(spec['cost_scale'] if cost_scale is None else cost_scale)
+    crystal_scale = n(spec['crystal_scale'] if crystal_scale is None else crystal_scale)
+
+    costs = {
+        material: n(fractions.Fraction(value) if isinstance(value, str) else value)
+        for material, value in spec.get('fixed', {}).items()
+    }
+    for material, value in spec.get('sieve', {}).items():
+        if isinstance(value, dict):
+            costs[material] = (n(value['weight']) / denominator) * cost_scale
+            if value.get('crystal'):
+                costs[material] *= crystal_scale
+
+        else:
+            costs[material] = (n(value) / denominator) * cost_scale
+
+    return costs
 
 
 class Components(collections.Counter):
@@ -65,498 +104,2283 @@ class Components(collections.Counter):
         return type(self)(super().__add__(other))
 
 
-def cost_of(c: Components, markup: float=1.0, round_up: float=None) -> float:
+class FrozenComponents(collections.abc.Mapping):
+    """
+    an immutable, hashable Components. equal values are interned to a single instance, and the results of `*`, `/`
+    and `+` are kept in a bounded LRU cache, so repeated sub-expressions such as `flux * 4` are only built once.
+    """
+    __slots__ = ('_counts', '_key', '__weakref__')
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, *args, **kwargs):
+        counts = dict(*args, **kwargs)
+        key = frozenset(counts.items())
+        self = cls._interned.get(key)
+        if self is None:
+            self = super().__new__(cls)
+            self._counts = counts
+            self._key = key
+            cls._interned[key] = self
+
+        return self
+
+    def __getitem__(self, key):
+        return self._counts.get(key, 0)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def __iter__(self):
+        return iter(self._counts)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenComponents):
+            return self is other
+
+        return super().__eq__(other)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._counts!r})'
+
+    def __mul__(self, n: int):
+        if not isinstance(n, int):
+            return NotImplemented
+
+        return _frozen_arithmetic(self, FrozenComponents._mul, n)
+
+    def __truediv__(self, n: int):
+        if not isinstance(n, int):
+            return NotImplemented
+
+        return _frozen_arithmetic(self, FrozenComponents._truediv, n)
+
+    def __add__(self, other):
+        if not isinstance(other, FrozenComponents):
+            return NotImplemented
+
+        return _frozen_arithmetic(self, FrozenComponents._add, other)
+
+    def _mul(self, n: int):
+        return type(self)({
+            key: val * n
+            for key, val in self._counts.items()
+        })
+
+    def _truediv(self, n: int):
+        return type(self)({
+            key: val / n
+            for key, val in self._counts.items()
+        })
+
+    def _add(self, other):
+        # same as Counter.__add__: only positive counts are kept
+        counts = {}
+        for key, val in self._counts.items():
+            total = val + other[key]
+            if total > 0:
+                counts[key] = total
+
+        for key, val in other._counts.items():
+            if key not in self._counts and val > 0:
+                counts[key] = val
+
+        return type(self)(counts)
+
+
+def _frozen_arithmetic(a, op, b):
+    return op(a, b)
+
+
+def set_frozen_cache_size(maxsize: int = 4096):
+    global _frozen_arithmetic
+    _frozen_arithmetic = functools.lru_cache(maxsize)(getattr(_frozen_arithmetic, '__wrapped__', _frozen_arithmetic))
+
+
+def frozen_cache_info() -> dict:
+    info = _frozen_arithmetic.cache_info()
+    return dict(info._asdict(), interned=len(FrozenComponents._interned))
+
+
+set_frozen_cache_size()
+
+
+class CompactComponents:
+    """
+    Components stored as a fixed-width array of doubles with one slot per raw material, instead of a dict with a hash
+    table and a boxed float per entry. the slots are those of MATERIALS, or of the costs given to for_costs(), which
+    RecipeGraph does for you.
+    """
+    __slots__ = ('_values',)
+    _materials = None  # set on the classes made by for_costs()
+    _index = None
+
+    @classmethod
+    def for_costs(cls, costs: typing.Mapping[str, float]) -> type:
+        return _compact_type(cls, tuple(costs))
+
+    @classmethod
+    def _slots(cls) -> typing.Tuple[typing.Tuple[str, ...], typing.Dict[str, int]]:
+        if cls._materials is None:
+            return _material_slots()
+
+        return cls._materials, cls._index
+
+    def __init__(self, counts=None, **kwargs):
+        materials, index = self._slots()
+        self._values = array.array('d', bytes(8 * len(materials)))
+        for key, val in dict(counts or (), **kwargs).items():
+            self._values[index[key]] = val
+
+    @classmethod
+    def _from_values(cls, values: array.array):
+        self = cls.__new__(cls)
+        self._values = values
+        return self
+
+    @classmethod
+    def from_dict(cls, counts: typing.Mapping[str, float]):
+        return cls(counts)
+
+    def to_dict(self) -> typing.Dict[str, float]:
+        return dict(self.items())
+
+    def __getitem__(self, key):
+        return self._values[self._slots()[1][key]]
+
+    def __iter__(self):
+        materials = self._slots()[0]
+        return (materials[i] for i, val in enumerate(self._values) if val)
+
+    def __len__(self):
+        return len(self._values) - self._values.count(0)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        materials = self._slots()[0]
+        return ((materials[i], val) for i, val in enumerate(self._values) if val)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactComponents):
+            return self._values == other._values
+
+        if isinstance(other, collections.abc.Mapping):
+            return self.to_dict() == {key: val for key, val in other.items() if val}
+
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def __mul__(self, n: int):
+        if not isinstance(n, int):
+            return NotImplemented
+
+        return self._from_values(array.array('d', [val * n for val in self._values]))
+
+    def __truediv__(self, n: int):
+        if not isinstance(n, int):
+            return NotImplemented
+
+        return self._from_values(array.array('d', [val / n for val in self._values]))
+
+    def __add__(self, other):
+        if not isinstance(other, CompactComponents):
+            return NotImplemented
+
+        return self._from_values(array.array('d', map(operator.add, self._values, other._values)))
+
+
+@functools.cache
+def _compact_type(base: type, materials: typing.Tuple[str, ...]) -> type:
+    index = {material: i for i, material in enumerate(materials)}
+    return type(base.__name__, (base,), dict(__slots__=(), _materials=materials, _index=index))
+
+
+class ExactComponents:
+    """
+    Components with exact quantities: integer numerators over a single shared integer denominator, so that chains
+    like `planks / 4` or `mese / 18` accumulate no rounding error and cost_of() can round up exactly. only the final
+    price is computed with Fractions.
+    """
+    __slots__ = ('_numerators', '_denominator')
+
+    def __init__(self, counts=None, **kwargs):
+        counts = {key: exact_number(val) for key, val in dict(counts or (), **kwargs).items()}
+        denominator = math.lcm(*(val.denominator for val in counts.values()))
+        self._numerators = {
+            key: val.numerator * (denominator // val.denominator)
+            for key, val in counts.items()
+        }
+        self._denominator = denominator
+
+    @classmethod
+    def _make(cls, numerators: typing.Dict[str, int], denominator: int):
+        divisor = math.gcd(denominator, *numerators.values())
+        if divisor != 1:
+            numerators = {key: val // divisor for key, val in numerators.items()}
+            denominator //= divisor
+
+        self = cls.__new__(cls)
+        self._numerators = numerators
+        self._denominator = denominator
+        return self
+
+    def __getitem__(self, key):
+        return fractions.Fraction(self._numerators.get(key, 0), self._denominator)
+
+    def __iter__(self):
+        return iter(self._numerators)
+
+    def __len__(self):
+        return len(self._numerators)
+
+    def keys(self):
+        return self._numerators.keys()
+
+    def items(self):
+        return (
+            (key, fractions.Fraction(val, self._denominator))
+            for key, val in self._numerators.items()
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, ExactComponents):
+            return self._denominator == other._denominator and self._numerators == other._numerators
+
+        if isinstance(other, collections.abc.Mapping):
+            return dict(self.items()) == dict(other.items())
+
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self.items())!r})'
+
+    def __mul__(self, n: int):
+        if not isinstance(n, int):
+            return NotImplemented
+
+        return self._make({key: val * n for key, val in self._numerators.items()}, self._denominator)
+
+    def __truediv__(self, n: int):
+        if not isinstance(n, int):
+            return NotImplemented
+
+        return self._make(dict(self._numerators), self._denominator * n)
+
+    def __add__(self, other):
+        if not isinstance(other, ExactComponents):
+            return NotImplemented
+
+        denominator = math.lcm(self._denominator, other._denominator)
+        mine = denominator // self._denominator
+        theirs = denominator // other._denominator
+        numerators = {key: val * mine for key, val in self._numerators.items()}
+        for key, val in other._numerators.items():
+            numerators[key] = numerators.get(key, 0) + val * theirs
+
+        # same as Counter.__add__: only positive counts are kept
+        return self._make({key: val for key, val in numerators.items() if val > 0}, denominator)
+
+    def cost_of(self, markup=1, round_up=None, costs: dict = None):
+        # float costs are taken as written too, so the rounding is always exact
+        if costs is None:
+            costs = default_costs(exact=True)
+
+        s = sum(exact_number(costs[key]) * val for key, val in self._numerators.items())
+        s = s * exact_number(markup) / self._denominator
+        if round_up is None:
+            return s
+
+        else:
+            return round_up * math.ceil(s / exact_number(round_up))
+
+
+def rounded(s: float, round_up: float=None) -> float:
+    if round_up is None:
+        return s
+
+    else:
+        return round_up * math.ceil(s / round_up)
+
+
+def cost_of(c: Components, markup: float=1.0, round_up: float=None, costs: dict=None) -> float:
+    if isinstance(c, ExactComponents):
+        return c.cost_of(markup, round_up, costs)
+
+    if costs is None:
+        costs = default_costs()
+
     s = sum(
-        COSTS[key] * value * markup
+        costs[key] * value * markup
         for key, value in c.items()
     )
+    return rounded(s, round_up)
+
+
+class Recipe(typing.NamedTuple):
+    # how many of each ingredient go into one craft, and how many items that craft makes
+    ingredients: typing.Mapping[str, int]
+    makes: int = 1
+
+
+class PriceLine(typing.NamedTuple):
+    label: str
+    item: str
+    qty: int = 1
+
+
+class Catalogue(typing.NamedTuple):
+    # the contents of a catalogue file such as terucost.toml
+    cost_spec: dict
+    recipes: typing.Dict[str, Recipe]
+    price_list: typing.Tuple[typing.Tuple[PriceLine, ...], ...]
+    bills: typing.Dict[str, typing.Dict[str, float]] = None  # every item's raw materials, once compiled
+    # every recipe of the items that have more than one, or a raw price as well; `recipes` holds the first
+    alternatives: typing.Dict[str, typing.Tuple[Recipe, ...]] = None
+    itemstrings: typing.Dict[str, str] = None  # the game's name for an item, where it isn't the item itself
+    rules: typing.Tuple['PricingRule', ...] = ()  # the [[policy]] rules
+
+    @property
+    def policy(self) -> 'PricingPolicy':
+        return PricingPolicy(self.rules)
+
+    def costs(self, **kwargs) -> dict:
+        return make_costs(spec=self.cost_spec, **kwargs)
+
+    def itemstring(self, item: str) -> str:
+        return (self.itemstrings or {}).get(item, item)
+
+    def has_itemstring(self, item: str) -> bool:
+        # whether the game knows the item by what itemstring() gives, i.e. it's mapped or already a `mod:name`
+        return ':' in self.itemstring(item)
+
+    def cheapest(self, costs: dict = None) -> 'Catalogue':
+        # the same catalogue, made the cheapest way at these prices
+        routes = cheapest_routes(self.recipes, self.alternatives or {}, self.costs() if costs is None else costs)
+        recipes = dict(self.recipes)
+        for item, route in routes.items():
+            if route.choice is None:
+                recipes.pop(item, None)
+            else:
+                recipes[item] = self.alternatives[item][route.choice]
+
+        if recipes == self.recipes:
+            return self
+
+        # the compiled bills are for the first recipes
+        return self._replace(recipes=recipes, bills=None)
+
+    def graph(self, components=Components, costs: dict = None, lazy: bool = False) -> 'RecipeGraph':
+        # only plain Components come from the compiled bills. the others are expanded from the recipes, so that their
+        # own arithmetic runs: exact quantities can't be recovered from float bills, and the frozen cache sees real use
+        bills = self.bills if components is Components else None
+        graph_type = LazyRecipeGraph if lazy else RecipeGraph
+        return graph_type(self.recipes, self.costs() if costs is None else costs, components, bills)
+
+
+def parse_catalogue(data: dict) -> Catalogue:
+    recipes = {}
+    alternatives = {}
+    priced = {*data['costs'].get('fixed', ()), *data['costs'].get('sieve', ())}
+    for item, value in data['recipes'].items():
+        options = []
+        # an array of tables is a list of alternative recipes for the same item
+        for ingredients in value if isinstance(value, list) else [value]:
+            ingredients = dict(ingredients)
+            makes = ingredients.pop('makes', 1)
+            options.append(Recipe(ingredients, makes))
+
+        # anything with a raw price is bought unless --cheapest finds it's cheaper to make
+        if item not in priced:
+            recipes[item] = options[0]
+
+        if len(options) > 1 or item in priced:
+            alternatives[item] = tuple(options)
+
+    price_list = tuple(
+        tuple(PriceLine(*line) for line in section['lines'])
+        for section in data.get('price_list', ())
+    )
+    groups = data.get('groups', {})
+    rules = []
+    for rule in data.get('policy', ()):
+        rule = dict(rule)
+        items = None
+        if 'group' in rule or 'items' in rule:
+            group = rule.pop('group', None)
+            if group is not None and group not in groups:
+                raise ValueError(f'policy rule uses unknown group {group!r}')
+
+            items = frozenset([*groups.get(group, ()), *rule.pop('items', ())])
+
+        rules.append(PricingRule(items, **rule))
+
+    return Catalogue(data['costs'], recipes, price_list, alternatives=alternatives,
+                     itemstrings=data.get('itemstrings', {}), rules=tuple(rules))
+
+
+def compile_catalogue(catalogue: Catalogue) -> Catalogue:
+    graph = RecipeGraph(catalogue.recipes, catalogue.costs())
+    return catalogue._replace(bills={item: dict(c) for item, c in graph.components.items()})
+
+
+def load_catalogue(path=None, use_cache: bool = True) -> Catalogue:
+    """
+    read and compile a catalogue file. the result is pickled next to it (`terucost.toml.cache`), and later loads
+    skip both parsing and recipe expansion as long as the file's mtime and size, or failing that its hash, match.
+    """
+    path = pathlib.Path(CATALOGUE_PATH if path is None else path)
+    cache_path = path.with_name(path.name + '.cache')
+    stat = path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _read_cache(cache_path) if use_cache else None
+    if cached is not None and cached['stamp'] == stamp:
+        return _unpack_catalogue(cached['catalogue'])
+
+    import hashlib
+    import tomllib
+
+    source = path.read_bytes()
+    digest = hashlib.sha256(source).hexdigest()
+    if cached is not None and cached['sha256'] == digest:
+        _write_cache(cache_path, dict(cached, stamp=stamp))
+        return _unpack_catalogue(cached['catalogue'])
+
+    catalogue = compile_catalogue(parse_catalogue(tomllib.loads(source.decode())))
+    if use_cache:
+        _write_cache(cache_path, dict(
+            version=_CACHE_VERSION,
+            stamp=stamp,
+            sha256=digest,
+            catalogue=_pack_catalogue(catalogue),
+        ))
+
+    return catalogue
+
+
+def _pack_catalogue(catalogue: Catalogue) -> tuple:
+    # plain builtins only, so the cache doesn't depend on whether this module was imported or run as __main__
+    return (
+        catalogue.cost_spec,
+        {item: (dict(recipe.ingredients), recipe.makes) for item, recipe in catalogue.recipes.items()},
+        tuple(tuple(tuple(line) for line in section) for section in catalogue.price_list),
+        catalogue.bills,
+        {
+            item: tuple((dict(recipe.ingredients), recipe.makes) for recipe in options)
+            for item, options in (catalogue.alternatives or {}).items()
+        },
+        catalogue.itemstrings,
+        tuple((None if rule.items is None else tuple(rule.items), *rule[1:]) for rule in catalogue.rules),
+    )
+
+
+def _unpack_catalogue(packed: tuple) -> Catalogue:
+    cost_spec, recipes, price_list, bills, alternatives, itemstrings, rules = packed
+    return Catalogue(
+        cost_spec,
+        {item: Recipe(*recipe) for item, recipe in recipes.items()},
+        tuple(tuple(PriceLine(*line) for line in section) for section in price_list),
+        bills,
+        {item: tuple(Recipe(*recipe) for recipe in options) for item, options in alternatives.items()},
+        itemstrings,
+        tuple(PricingRule(None if items is None else frozenset(items), *rest) for items, *rest in rules),
+    )
+
+
+def _read_cache(cache_path: pathlib.Path) -> typing.Optional[dict]:
+    try:
+        with cache_path.open('rb') as fh:
+            cached = pickle.load(fh)
+
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get('version') != _CACHE_VERSION:
+        return None
+
+    return cached
+
+
+def _write_cache(cache_path: pathlib.Path, cached: dict):
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    try:
+        with tmp_path.open('wb') as fh:
+            pickle.dump(cached, fh, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_path, cache_path)
+
+    except OSError:
+        # a read-only checkout just doesn't get a cache
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+
+def strongly_connected(roots: typing.Iterable[str], edges, done: typing.Container[str] = ()
+                       ) -> typing.Iterator[typing.List[str]]:
+    """
+    Tarjan's algorithm, without recursion: the strongly connected components reachable from `roots`, each one after
+    every component it has an edge into, so for recipes an item comes after everything it's made from. nodes in
+    `done` are skipped. on an acyclic graph this is a plain depth-first topological sort.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    for root in roots:
+        if root in index or root in done:
+            continue
+
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges(root)))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor in done:
+                    continue
+
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(edges(successor))))
+                    break
+
+                if successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+
+                    component.reverse()
+                    yield component
+
+
+def _invert(matrix: typing.List[typing.List[fractions.Fraction]]) -> typing.Optional[list]:
+    # Gauss-Jordan elimination over Fractions; None if the matrix is singular
+    n = len(matrix)
+    rows = [row[:] + [fractions.Fraction(int(i == j)) for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next((r for r in range(col, n) if rows[r][col] != 0), None)
+        if pivot is None:
+            return None
+
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        scale = rows[col][col]
+        rows[col] = [x / scale for x in rows[col]]
+        for r in range(n):
+            if r != col and rows[r][col] != 0:
+                factor = rows[r][col]
+                rows[r] = [x - factor * y for x, y in zip(rows[r], rows[col])]
+
+    return [row[n:] for row in rows]
+
+
+class Route(typing.NamedTuple):
+    # how an item is cheapest to get: choice is the index of its recipe, or None to buy it at its raw price
+    choice: typing.Optional[int]
+    costs: tuple  # unit cost by each recipe
+    raw: float = None  # the raw price, for items that have one
+
+    @property
+    def cost(self):
+        return self.raw if self.choice is None else self.costs[self.choice]
+
+
+def cheapest_routes(recipes: typing.Mapping[str, Recipe], alternatives: typing.Mapping[str, typing.Sequence[Recipe]],
+                    costs: dict, tolerance: float = 1e-9, max_rounds: int = 1000) -> typing.Dict[str, Route]:
+    """
+    pick the cheapest way to get every item in `alternatives`, by unmarked unit cost at these raw material prices.
+    buying an item that has a raw price counts as its first route, ahead of its recipes, and the first route is kept
+    unless another is cheaper by more than the relative tolerance.
+
+    each strongly connected component of the recipe graph is solved once, after everything it uses. a single item
+    is just costed; a cycle, like ingots and blocks that craft into each other, is relaxed from its raw prices until
+    nothing gets cheaper.
+    """
+    def options(item):
+        return alternatives.get(item) or ((recipes[item],) if item in recipes else ())
+
+    def buyable(item):
+        return item not in recipes and item in costs
+
+    def ingredients(item):
+        out = dict.fromkeys(ingredient for recipe in options(item) for ingredient in recipe.ingredients)
+        for ingredient in out:
+            if ingredient not in recipes and ingredient not in costs:
+                raise ValueError(f'{item} uses unknown item {ingredient}')
+
+        return out
+
+    unit = {}
+
+    def route(item):
+        prices = tuple(
+            sum(unit.get(ingredient, math.inf) * count for ingredient, count in recipe.ingredients.items())
+            / recipe.makes
+            for recipe in options(item)
+        )
+        raw = costs[item] if buyable(item) else None
+        choice, best = (None, raw) if raw is not None else (0, prices[0])
+        for i, price in enumerate(prices):
+            if price < best * (1 - tolerance):
+                choice, best = i, price
+
+        return Route(choice, prices, raw)
+
+    routes = {}
+    for component in strongly_connected([*recipes, *alternatives], ingredients):
+        if len(component) > 1 or component[0] in ingredients(component[0]):
+            # start from the raw prices and relax; every round can only make things cheaper
+            for item in component:
+                unit[item] = costs[item] if buyable(item) else math.inf
+
+            for _ in range(max_rounds):
+                cheaper = False
+                for item in component:
+                    cost = route(item).cost
+                    if cost < unit[item] * (1 - tolerance):
+                        unit[item] = cost
+                        cheaper = True
+
+                if not cheaper:
+                    break
+
+            else:
+                raise ValueError(f'recipe cycle through {component[0]} makes something from nothing')
+
+            for item in component:
+                if unit[item] == math.inf:
+                    raise ValueError(f'recipe cycle through {item} can only be made from itself')
+
+        for item in component:
+            if not options(item):
+                unit[item] = costs[item]
+                continue
+
+            found = route(item)
+            unit[item] = found.cost
+            if item in alternatives:
+                routes[item] = found
+
+    return routes
+
+
+class RecipeGraph:
+    """
+    recipes compiled into topological order, so that each item's components are built exactly once and then
+    shared by everything that uses it. items on a recipe cycle are solved together, as a linear system.
+    """
+    def __init__(self, recipes: typing.Mapping[str, Recipe] = None, costs: dict = None, components=Components,
+                 bills: typing.Mapping[str, typing.Mapping[str, float]] = None):
+        self.recipes = default_catalogue().recipes if recipes is None else recipes
+        self.costs = default_costs(issubclass(components, ExactComponents)) if costs is None else costs
+        if hasattr(components, 'for_costs'):
+            components = components.for_costs(self.costs)
+
+        self.components_type = components
+        self._uses = None
+        if bills is not None:
+            # already expanded, e.g. by load_catalogue()
+            self.order = list(bills)
+            self.components = {item: components(bill) for item, bill in bills.items()}
+            return
+
+        self.order = []
+        self.components = {}
+        for component in self._strongly_connected():
+            self.order.extend(component)
+            self._build(component, self.components)
+
+    def is_raw(self, item: str) -> bool:
+        return item not in self.recipes and item in self.costs
+
+    def _ingredients(self, item: str) -> typing.Iterable[str]:
+        if self.is_raw(item):
+            return ()
+
+        ingredients = self.recipes[item].ingredients
+        for ingredient in ingredients:
+            if ingredient not in self.recipes and ingredient not in self.costs:
+                raise ValueError(f'{item} uses unknown item {ingredient}')
+
+        return ingredients
+
+    def _strongly_connected(self) -> typing.Iterator[typing.List[str]]:
+        # every raw material is a node, whether or not anything uses it
+        raw = [material for material in self.costs if material not in self.recipes]
+        for material in raw:
+            yield [material]
+
+        yield from strongly_connected(self.recipes, self._ingredients, set(raw))
+
+    def _toposort(self) -> typing.List[str]:
+        return [item for component in self._strongly_connected() for item in component]
+
+    def _build(self, component: typing.List[str], into: typing.Dict[str, Components]):
+        if len(component) > 1 or component[0] in self._ingredients(component[0]):
+            into.update(self._solve_cycle(component))
+        else:
+            into[component[0]] = self._expand(component[0])
+
+    def _expand(self, item: str) -> Components:
+        if self.is_raw(item):
+            return self.components_type({item: 1})
+
+        recipe = self.recipes[item]
+        total = None
+        for ingredient, count in recipe.ingredients.items():
+            part = self.components[ingredient] * count
+            total = part if total is None else total + part
+
+        if recipe.makes != 1:
+            total = total / recipe.makes
+
+        return total
+
+    def _solve_cycle(self, members: typing.List[str]) -> typing.Dict[str, Components]:
+        """
+        items on a recipe cycle, like a recycler that gives back some of what went into it. if M[i][j] is how much
+        of member j goes into one of member i, and E[i] is what one of member i takes from outside the cycle, then
+        X = M X + E, so X = (I - M)^-1 E. for ExactComponents, or without numpy, the inverse is exact and the
+        Components only see integer `*` and `/`; otherwise it's solved in floating point, as exact elimination gets
+        very slow on cycles of more than a few dozen items.
+        """
+        index = {item: i for i, item in enumerate(members)}
+        matrix = [[fractions.Fraction(int(i == j)) for j in range(len(members))] for i in range(len(members))]
+        outside = []
+        for i, item in enumerate(members):
+            recipe = self.recipes[item]
+            total = None
+            for ingredient, count in recipe.ingredients.items():
+                if ingredient in index:
+                    matrix[i][index[ingredient]] -= exact_number(count) / recipe.makes
+                else:
+                    part = self.components[ingredient] * count
+                    total = part if total is None else total + part
+
+            if total is not None and recipe.makes != 1:
+                total = total / recipe.makes
+
+            outside.append(total)
+
+        if all(part is None for part in outside):
+            raise ValueError(f'recipe cycle through {", ".join(members)} can only be made from itself')
+
+        if np is not None and not issubclass(self.components_type, ExactComponents):
+            return self._solve_cycle_float(members, matrix, outside)
+
+        inverse = _invert(matrix)
+        # a singular or partly negative inverse means the cycle doesn't settle: it's all output or all input
+        if inverse is None or any(x < 0 for row in inverse for x in row):
+            raise ValueError(f'recipe cycle through {", ".join(members)} has no solution')
+
+        solved = {}
+        for item, row in zip(members, inverse):
+            total = None
+            for x, part in zip(row, outside):
+                if x == 0 or part is None:
+                    continue
+
+                if x.numerator != 1:
+                    part = part * x.numerator
+                if x.denominator != 1:
+                    part = part / x.denominator
+
+                total = part if total is None else total + part
+
+            if total is None:
+                raise ValueError(f'{item} is on a recipe cycle that can only be made from itself')
+
+            solved[item] = total
+
+        return solved
+
+    def _solve_cycle_float(self, members: typing.List[str], matrix: list, outside: list
+                           ) -> typing.Dict[str, Components]:
+        parts = [() if part is None else list(part.items()) for part in outside]
+        materials = list(dict.fromkeys(material for part in parts for material, _ in part))
+        columns = {material: j for j, material in enumerate(materials)}
+        external = np.zeros((len(members), len(materials)))
+        for i, part in enumerate(parts):
+            for material, val in part:
+                external[i, columns[material]] = val
+
+        try:
+            inverse = np.linalg.inv(np.array(matrix, dtype=float))
+        except np.linalg.LinAlgError:
+            inverse = None
+
+        if inverse is None or not np.isfinite(inverse).all() or (inverse < -1e-9).any():
+            raise ValueError(f'recipe cycle through {", ".join(members)} has no solution')
+
+        solved = {}
+        for item, row in zip(members, inverse @ external):
+            counts = {material: val for material, val in zip(materials, row.tolist()) if val > 0}
+            if not counts:
+                raise ValueError(f'{item} is on a recipe cycle that can only be made from itself')
+
+            solved[item] = self.components_type(counts)
+
+        return solved
+
+    def price(self, item: str, qty: int = 1, markup: float = 1.0, round_up: float = None) -> float:
+        c = self.components[item]
+        if qty != 1:
+            c = c * qty
+
+        return cost_of(c, markup, round_up, self.costs)
+
+    def price_all(self, markup: float = 1.0, round_up: float = None) -> typing.Dict[str, float]:
+        return {
+            item: cost_of(c, markup, round_up, self.costs)
+            for item, c in self.components.items()
+        }
+
+    def reverse_index(self) -> typing.Dict[str, typing.List[typing.Tuple[str, float]]]:
+        # raw material -> [(item, how much of the material is in one item), ...], most first
+        if self._uses is None:
+            self._uses = {material: [] for material in self.costs}
+            for item, c in self.components.items():
+                for material, value in c.items():
+                    self._uses[material].append((item, value))
+
+            for uses in self._uses.values():
+                uses.sort(key=operator.itemgetter(1), reverse=True)
+
+        return self._uses
+
+    def sensitivity(self, material: str, markup: float = 1.0) -> typing.Dict[str, float]:
+        # d(price) / d(price of the material) for every item that contains it, before rounding
+        return {item: value * markup for item, value in self.reverse_index()[material]}
+
+    def most_sensitive(self, material: str, n: int = 10, markup: float = 1.0) -> typing.List[typing.Tuple[str, float]]:
+        return [(item, value * markup) for item, value in self.reverse_index()[material][:n]]
+
+
+class _LazyComponents(collections.abc.Mapping):
+    # item -> Components, expanding each item the first time it's looked up. iterating forces the whole catalogue
+    def __init__(self, graph: 'LazyRecipeGraph'):
+        self._graph = graph
+        self.expanded = {}
+
+    def __getitem__(self, item):
+        c = self.expanded.get(item)
+        if c is None:
+            c = self._graph.resolve(item)
+
+        return c
+
+    def __contains__(self, item):
+        return item in self._graph.recipes or item in self._graph.costs
+
+    def __iter__(self):
+        return iter(self._graph.order)
+
+    def __len__(self):
+        return len(self._graph.order)
+
+
+class LazyRecipeGraph(RecipeGraph):
+    """
+    a RecipeGraph that doesn't expand anything up front: pricing an item expands just that item and what it's made
+    from, once, so a single price costs in proportion to the item's own subtree rather than the whole catalogue.
+    """
+    def __init__(self, recipes: typing.Mapping[str, Recipe] = None, costs: dict = None, components=Components,
+                 bills: typing.Mapping[str, typing.Mapping[str, float]] = None):
+        self.recipes = default_catalogue().recipes if recipes is None else recipes
+        self.costs = default_costs(issubclass(components, ExactComponents)) if costs is None else costs
+        if hasattr(components, 'for_costs'):
+            components = components.for_costs(self.costs)
+
+        self.components_type = components
+        self.bills = bills
+        self._uses = None
+        self._order = None
+        self.components = _LazyComponents(self)
+
+    @property
+    def order(self) -> typing.List[str]:
+        if self._order is None:
+            self._order = list(self.bills) if self.bills is not None else self._toposort()
+
+        return self._order
+
+    def resolve(self, item: str) -> Components:
+        expanded = self.components.expanded
+        if item in expanded:
+            return expanded[item]
+
+        if item not in self.components:
+            raise KeyError(item)
+
+        if self.bills is not None:
+            c = expanded[item] = self.components_type(self.bills[item])
+            return c
+
+        # the same walk as the full graph, but only below `item` and stopping at anything already expanded
+        for component in strongly_connected([item], self._ingredients, expanded):
+            self._build(component, expanded)
+
+        return expanded[item]
+
+
+class _Tally:
+    __slots__ = ('count', 'seconds', 'max_size')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_size = 0
+
+
+class Profiler:
+    """
+    counts and times Components operations and cost_of() calls, grouped by the item being defined or priced.
+    """
+    def __init__(self):
+        self.item = None
+        self.phase = None
+        self.stats = collections.defaultdict(_Tally)  # (phase, item, op) -> _Tally
+
+    @contextlib.contextmanager
+    def defining(self, item: str, phase: str = 'expand'):
+        outer = self.item, self.phase
+        self.item, self.phase = item, phase
+        try:
+            yield
+        finally:
+            self.item, self.phase = outer
+
+    def record(self, op: str, seconds: float, result):
+        tally = self.stats[self.phase, self.item, op]
+        tally.count += 1
+        tally.seconds += seconds
+        tally.max_size = max(tally.max_size, len(result))
+
+    def report(self, graph: RecipeGraph = None, top: int = None) -> str:
+        """
+        one row per item, slowest first. given the graph, also the number of operations it takes to build the item
+        from scratch, i.e. summed over everything it's made from.
+        """
+        rows = collections.defaultdict(lambda: dict(ops=0, ops_time=0.0, size=0, calls=0, cost_time=0.0))
+        for (phase, item, op), tally in self.stats.items():
+            row = rows[item]
+            if op == 'cost_of':
+                row['calls'] += tally.count
+                row['cost_time'] += tally.seconds
+            else:
+                row['ops'] += tally.count
+                row['ops_time'] += tally.seconds
+                row['size'] = max(row['size'], tally.max_size)
+
+        subtree = {}
+        if graph is not None:
+            # one closure per strongly connected component, shared by the items of a recipe cycle
+            closures = {}
+            for component in graph._strongly_connected():
+                closure = set(component).union(*(
+                    closures[ingredient]
+                    for item in component for ingredient in graph._ingredients(item) if ingredient not in component
+                ))
+                for item in component:
+                    closures[item] = closure
+                    subtree[item] = sum(rows[i]['ops'] for i in closure if i in rows)
+
+        extra = f'{"subtree ops":>13}' if graph is not None else ''
+        lines = [f'{"item":28}{"ops":>8}{"ops us":>12}{"max size":>10}{"cost_of":>9}{"cost_of us":>12}{extra}']
+        ranked = sorted(rows.items(), key=lambda kv: kv[1]['ops_time'] + kv[1]['cost_time'], reverse=True)
+        for item, row in ranked[:top]:
+            extra = f'{subtree.get(item, 0):13}' if graph is not None else ''
+            lines.append(f'{item:28}{row["ops"]:8}{row["ops_time"] * 1e6:12.1f}{row["size"]:10}'
+                         f'{row["calls"]:9}{row["cost_time"] * 1e6:12.1f}{extra}')
+
+        ops = sum(row['ops'] for row in rows.values())
+        calls = sum(row['calls'] for row in rows.values())
+        seconds = sum(tally.seconds for tally in self.stats.values())
+        lines.append(f'{len(rows)} items, {ops} operations, {calls} cost_of calls, {seconds * 1e3:.2f} ms')
+        return '\n'.join(lines) + '\n'
+
+    def collapsed(self) -> str:
+        # one `phase;item;op nanoseconds` line per stack: the input format of flamegraph.pl and speedscope
+        return ''.join(
+            f'{phase};{item};{op} {round(tally.seconds * 1e9)}\n'
+            for (phase, item, op), tally in sorted(self.stats.items())
+        )
+
+
+def instrumented(components_type, profiler: Profiler):
+    """
+    a subclass of components_type that reports every `*`, `/` and `+` to the profiler. the plain classes aren't
+    touched, so graphs built without it pay nothing.
+    """
+    def timed(op, method):
+        def wrapper(self, other):
+            start = time.perf_counter()
+            result = method(self, other)
+            if result is not NotImplemented:
+                profiler.record(op, time.perf_counter() - start, result)
+
+            return result
+
+        return wrapper
+
+    namespace = dict(
+        __slots__=(),
+        __mul__=timed('*', components_type.__mul__),
+        __truediv__=timed('/', components_type.__truediv__),
+        __add__=timed('+', components_type.__add__),
+    )
+    if issubclass(components_type, FrozenComponents):
+        # interned separately, or the cache would hand back uninstrumented instances
+        namespace['_interned'] = weakref.WeakValueDictionary()
+
+    return type(f'Instrumented{components_type.__name__}', (components_type,), namespace)
+
+
+class ProfiledRecipeGraph(RecipeGraph):
+    """
+    a RecipeGraph that reports its expansion and pricing to a Profiler.
+    """
+    def __init__(self, recipes: typing.Mapping[str, Recipe] = None, costs: dict = None, components=Components,
+                 profiler: Profiler = None):
+        self.profiler = Profiler() if profiler is None else profiler
+        super().__init__(recipes, costs, instrumented(components, self.profiler))
+
+    def _expand(self, item: str) -> Components:
+        with self.profiler.defining(item):
+            return super()._expand(item)
+
+    def _solve_cycle(self, members: typing.List[str]) -> typing.Dict[str, Components]:
+        # the whole cycle is solved at once, so its operations are put down to its first member
+        with self.profiler.defining(members[0], 'cycle'):
+            return super()._solve_cycle(members)
+
+    def price(self, item: str, qty: int = 1, markup: float = 1.0, round_up: float = None) -> float:
+        with self.profiler.defining(item, 'price'):
+            c = self.components[item]
+            if qty != 1:
+                c = c * qty
+
+            start = time.perf_counter()
+            price = cost_of(c, markup, round_up, self.costs)
+            self.profiler.record('cost_of', time.perf_counter() - start, c)
+
+        return price
+
+    def price_all(self, markup: float = 1.0, round_up: float = None) -> typing.Dict[str, float]:
+        return {item: self.price(item, 1, markup, round_up) for item in self.components}
+
+
+class PricingSession:
+    """
+    a long-lived price table. changing the price of a raw material only touches the items that contain it, by
+    adding the price delta times the quantity of that material in the item.
+    """
+    def __init__(self, graph: RecipeGraph = None, markup: float = 1.0, round_up: float = None,
+                 policy: 'PricingPolicy' = None):
+        self.graph = RecipeGraph() if graph is None else graph
+        self.markup = markup
+        self.round_up = round_up
+        self.policy = PricingPolicy() if policy is None else policy
+        self.costs = dict(self.graph.costs)
+        self.uses = self.graph.reverse_index()
+        self.base = {
+            item: cost_of(c, costs=self.costs)
+            for item, c in self.graph.components.items()
+        }
+
+    def settings(self, item: str, qty: float = 1) -> typing.Tuple[float, float]:
+        # (markup, round_up) for this many of the item, under the policy
+        return self.policy.settings(item, qty, self.markup, self.round_up)
+
+    def price(self, item: str, qty: int = 1) -> float:
+        markup, round_up = self.settings(item, qty)
+        return rounded(self.base[item] * qty * markup, round_up)
+
+    def update(self, costs: dict = None, **prices) -> typing.Dict[str, float]:
+        """
+        set new raw material prices, e.g. `session.update(mithril_ingot=3.2)` or `session.update(make_costs(700))`.
+        returns the new price of every item that changed.
+        """
+        if costs is not None:
+            prices = {**costs, **prices}
+
+        changed = set()
+        for material, new in prices.items():
+            if material not in self.costs:
+                raise KeyError(material)
+
+            delta = new - self.costs[material]
+            if delta == 0:
+                continue
+
+            self.costs[material] = new
+            for item, value in self.uses[material]:
+                self.base[item] += delta * value
+                changed.add(item)
+
+        return {item: self.price(item) for item in changed}
+
+
+class Plan(typing.NamedTuple):
+    crafts: typing.Dict[str, int]  # how many times to craft each recipe, in an order that can be followed
+    bill: typing.Dict[str, int]  # raw materials to buy
+    leftovers: typing.Dict[str, int]  # what's over once the order is made, because recipes make whole batches
+
+
+def plan_production(graph: RecipeGraph, order: typing.Mapping[str, int],
+                    stock: typing.Mapping[str, int] = None) -> Plan:
+    """
+    what to buy and craft to make a whole order, in whole crafts. every item is planned once, after everything that
+    uses it, so the demand for shared intermediates is pooled across the order before their batches are rounded up.
+    items in `stock` are used before anything is made.
+    """
+    rank = {item: i for i, item in enumerate(graph.order)}
+    need = collections.Counter()
+    have = collections.Counter(stock or {})
+    queue = []  # (-rank, item): the latest item in topological order first, i.e. users before their ingredients
+    planned = set()
+
+    def demand(item, qty):
+        if item not in rank:
+            raise KeyError(item)
+
+        # already planned means it's needed by something made from it
+        if item in planned:
+            raise ValueError(f'{item} is on a recipe cycle, which has no batch plan')
+
+        if item not in need:
+            heapq.heappush(queue, (-rank[item], item))
+
+        need[item] += qty
+
+    for item, qty in order.items():
+        if qty <= 0:
+            raise ValueError(f'cannot plan {qty} {item}; quantities must be positive')
+
+        demand(item, qty)
+
+    crafts = {}
+    bill = {}
+    while queue:
+        _, item = heapq.heappop(queue)
+        planned.add(item)
+        short = need[item] - have[item]
+        have[item] = max(0, -short)
+        if short <= 0:
+            continue
+
+        if graph.is_raw(item):
+            bill[item] = short
+            continue
+
+        recipe = graph.recipes[item]
+        batches = -(-short // recipe.makes)
+        crafts[item] = batches
+        have[item] += batches * recipe.makes - short
+        for ingredient, count in recipe.ingredients.items():
+            demand(ingredient, batches * count)
+
+    leftovers = {item: qty for item, qty in have.items() if qty > 0}
+    in_order = functools.partial(sorted, key=lambda item_qty: rank[item_qty[0]])
+    return Plan(dict(reversed(crafts.items())), dict(in_order(bill.items())), dict(in_order(leftovers.items())))
+
+
+class MaterialMatrix:
+    """
+    every item's bill of raw materials as a row of a dense matrix with one column per raw material, so that pricing
+    the whole catalogue is a single matrix-vector product.
+    """
+    def __init__(self, graph: RecipeGraph):
+        if np is None:
+            raise RuntimeError('the numpy backend requires numpy')
+
+        self.costs = graph.costs
+        self.items = list(graph.order)
+        self.index = {item: i for i, item in enumerate(self.items)}
+        self.materials = tuple(graph.costs)
+        columns = {material: j for j, material in enumerate(self.materials)}
+
+        self.matrix = np.zeros((len(self.items), len(self.materials)))
+        for i, item in enumerate(self.items):
+            for material, value in graph.components[item].items():
+                self.matrix[i, columns[material]] = value
+
+        self.cost_vector = self.costs_to_vector(self.costs)
+
+    def costs_to_vector(self, costs: dict) -> 'np.ndarray':
+        return np.array([costs[material] for material in self.materials], dtype=float)
+
+    def base_costs(self, costs: dict = None) -> 'np.ndarray':
+        vector = self.cost_vector if costs is None else self.costs_to_vector(costs)
+        return self.matrix @ vector
+
+    def rows(self, items: typing.Iterable[str]) -> 'np.ndarray':
+        return np.fromiter((self.index[item] for item in items), dtype=np.intp)
+
+    def price_all(self, markup=1.0, round_up=None, costs: dict = None) -> 'np.ndarray':
+        return apply_price(self.base_costs(costs), 1, markup, round_up)
+
+    def price_lines(self, lines: typing.Sequence[PriceLine], markup=1.0, round_up=None, costs: dict = None):
+        # markup and round_up may be arrays with one entry per line
+        rows = self.rows(line.item for line in lines)
+        qty = np.array([line.qty for line in lines], dtype=float)
+        return apply_price(self.base_costs(costs)[rows], qty, markup, round_up)
+
+
+def apply_price(base, qty=1, markup=1.0, round_up=None):
+    # vectorized counterpart of cost_of(); every argument may be a scalar or an array. a NaN round_up doesn't round
+    s = base * qty * markup
     if round_up is None:
         return s
 
     else:
-        return round_up * math.ceil(s / round_up)
+        return np.where(np.isnan(round_up), s, round_up * np.ceil(s / round_up))
+
+
+class PricingRule(typing.NamedTuple):
+    # None leaves a setting as it was
+    items: typing.FrozenSet[str] = None  # None matches every item
+    min_qty: float = 1  # only lines of at least this many
+    markup: float = None  # replaces the markup
+    markup_scale: float = None  # multiplies it, e.g. for volume discounts
+    round_up: float = None  # replaces the rounding granularity
+
+
+class PricingPolicy:
+    """
+    markup and rounding by item and quantity. the rules are applied in order to everything being priced, each one
+    overriding what earlier ones set for the lines it matches.
+    """
+    def __init__(self, rules: typing.Iterable[PricingRule] = ()):
+        self.rules = tuple(rules)
+
+    def settings(self, item: str, qty: float, markup: float, round_up: float) -> typing.Tuple[float, float]:
+        # (markup, round_up) for one line
+        for rule in self.rules:
+            if qty < rule.min_qty or rule.items is not None and item not in rule.items:
+                continue
+
+            if rule.markup is not None:
+                markup = rule.markup
+            if rule.markup_scale is not None:
+                markup *= rule.markup_scale
+            if rule.round_up is not None:
+                round_up = rule.round_up
+
+        return markup, round_up
+
+    def arrays(self, items: typing.Sequence[str], qty, markup: float, round_up: float):
+        """
+        the same for many lines at once, one masked assignment per rule: a float array of markups, and the rounding
+        granularities as an object array so that an integer granularity can still be told from a float one. its
+        astype(float) is what apply_price() takes, with NaN where there's no rounding.
+        """
+        # items are matched by number, as np.isin() over strings is slow
+        codes = {item: i for i, item in enumerate(dict.fromkeys(items))}
+        lines = np.fromiter((codes[item] for item in items), dtype=np.intp, count=len(items))
+        qty = np.broadcast_to(np.asarray(qty, dtype=float), lines.shape)
+        markups = np.full(lines.shape, markup, dtype=float)
+        round_ups = np.full(lines.shape, round_up, dtype=object)
+        for rule in self.rules:
+            mask = qty >= rule.min_qty
+            if rule.items is not None:
+                matched = np.zeros(len(codes), dtype=bool)
+                matched[[codes[item] for item in rule.items if item in codes]] = True
+                mask &= matched[lines]
+
+            if rule.markup is not None:
+                markups[mask] = rule.markup
+            if rule.markup_scale is not None:
+                markups[mask] *= rule.markup_scale
+            if rule.round_up is not None:
+                round_ups[mask] = rule.round_up
+
+        return markups, round_ups
+
+
+def price_items(graph: RecipeGraph, markup: float, round_up: float, policy: PricingPolicy = None
+                ) -> typing.Dict[str, float]:
+    # one of every item, under the policy. the whole table is priced in one pass unless it has to be exact
+    policy = PricingPolicy() if policy is None else policy
+    if np is None or issubclass(graph.components_type, ExactComponents):
+        return {item: graph.price(item, 1, *policy.settings(item, 1, markup, round_up)) for item in graph.components}
+
+    matrix = MaterialMatrix(graph)
+    markups, round_ups = policy.arrays(matrix.items, 1, markup, round_up)
+    prices = apply_price(matrix.base_costs(), 1, markups, round_ups.astype(float))
+    return dict(zip(matrix.items, prices.tolist()))
+
+
+@functools.cache
+def default_catalogue() -> Catalogue:
+    return load_catalogue()
+
+
+@functools.cache
+def default_costs(exact: bool = False) -> dict:
+    return default_catalogue().costs(exact=exact)
+
+
+@functools.cache
+def _material_slots() -> typing.Tuple[typing.Tuple[str, ...], typing.Dict[str, int]]:
+    # fixed index of each raw material, for array-backed representations
+    materials = tuple(default_costs())
+    return materials, {material: i for i, material in enumerate(materials)}
+
+
+@functools.cache
+def default_graph() -> 'LazyRecipeGraph':
+    # from the compiled bills in the catalogue cache when there is one, so a lookup is just a dict copy
+    catalogue = default_catalogue()
+    return LazyRecipeGraph(catalogue.recipes, default_costs(), Components, catalogue.bills)
+
+
+# nothing is loaded at import time: these are built the first time they're used, e.g. `terucost.items['tube']`
+_DEFAULTS = dict(
+    CATALOGUE=default_catalogue,
+    COSTS=default_costs,
+    RECIPES=lambda: default_catalogue().recipes,
+    PRICE_LIST=lambda: default_catalogue().price_list,
+    MATERIALS=lambda: _material_slots()[0],
+    MATERIAL_INDEX=lambda: _material_slots()[1],
+    items=lambda: default_graph().components,
+)
+
+
+def __getattr__(name: str):
+    if name in _DEFAULTS:
+        return _DEFAULTS[name]()
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+COMPONENTS = dict(
+    counter=Components,
+    frozen=FrozenComponents,
+    compact=CompactComponents,
+    exact=ExactComponents,
+)
+
+
+def open_catalogue(args) -> Catalogue:
+    if args.catalogue is None and not args.no_cache:
+        return default_catalogue()
+
+    return load_catalogue(args.catalogue, use_cache=not args.no_cache)
+
+
+def price_table(graph: RecipeGraph, price_list, markup: float, round_up: float, backend: str = 'auto',
+                raw: bool = False, policy: PricingPolicy = None) -> typing.List[typing.List[typing.Tuple[str, float]]]:
+    """
+    the price list as one [(label, price), ...] per section. raw=True skips rounding altogether. the auto backend is
+    numpy, all lines in one pass, unless numpy is missing or the prices have to be exact.
+    """
+    policy = PricingPolicy() if policy is None else policy
+    if backend == 'auto':
+        backend = 'graph' if np is None or issubclass(graph.components_type, ExactComponents) else 'numpy'
+
+    if backend == 'numpy':
+        matrix = MaterialMatrix(graph)
+        lines = [line for section in price_list for line in section]
+        markups, round_ups = policy.arrays([line.item for line in lines], [line.qty for line in lines], markup,
+                                           round_up)
+        prices = matrix.price_lines(lines, markups, None if raw else round_ups.astype(float))
+        prices = iter(zip(prices.tolist(), round_ups.tolist()))
+
+    table = []
+    for section in price_list:
+        rows = []
+        for line in section:
+            if backend == 'numpy':
+                price, line_round_up = next(prices)
+                if not raw and line_round_up is not None:
+                    price = type(line_round_up)(price)  # integer granularities come out as ints, as from cost_of()
+            else:
+                line_markup, line_round_up = policy.settings(line.item, line.qty, markup, round_up)
+                price = graph.price(line.item, line.qty, line_markup, None if raw else line_round_up)
+
+            rows.append((line.label, price))
+
+        table.append(rows)
+
+    return table
+
+
+def format_price_table(table) -> str:
+    return '\n\n'.join(
+        '\n'.join(f'{label:20} {price}' for label, price in section)
+        for section in table
+    ) + '\n'
+
+
+def read_price_table(path) -> typing.List[typing.Tuple[str, float]]:
+    # parses what format_price_table() (or main()) wrote: a label padded to 20 columns, or longer, then the price
+    rows = []
+    with open(path) as fh:
+        for line in fh:
+            if line.strip():
+                label, price = line.rstrip().rsplit(None, 1)
+                rows.append((label.strip(), _number(price)))
+
+    return rows
+
+
+def compare_prices(golden, current, tolerance: float = 0.0, relative: bool = False):
+    """
+    compare two [(label, price), ...] lists. labels may repeat (there are two reformers), so rows are matched by
+    label and occurrence. returns [(label, old, new), ...] for everything that moved by more than the tolerance,
+    with None for rows that only exist on one side.
+    """
+    def keyed(rows):
+        seen = collections.Counter()
+        out = {}
+        for label, price in rows:
+            out[label, seen[label]] = price
+            seen[label] += 1
+
+        return out
+
+    old = keyed(golden)
+    new = keyed(current)
+    changes = []
+    for key in [*new, *(key for key in old if key not in new)]:
+        a = old.get(key)
+        b = new.get(key)
+        if a is None or b is None:
+            changes.append((key[0], a, b))
+            continue
+
+        limit = tolerance * abs(a) if relative else tolerance
+        if abs(b - a) > limit:
+            changes.append((key[0], a, b))
+
+    return changes
+
+
+def write_lua(path, prices: typing.Mapping[str, float]):
+    with open(path, 'w') as fh:
+        fh.write('-- item prices from terucost.py\nreturn {\n')
+        for key, price in prices.items():
+            fh.write(f'    [{json.dumps(key)}] = {float(price)!r},\n')
+
+        fh.write('}\n')
+
+
+def write_csv(path, prices: typing.Mapping[str, float]):
+    import csv
+
+    with open(path, 'w', newline='') as fh:
+        out = csv.writer(fh)
+        out.writerow(['itemstring', 'price'])
+        out.writerows((key, float(price)) for key, price in prices.items())
+
+
+def write_json(path, prices: typing.Mapping[str, float]):
+    with open(path, 'w') as fh:
+        json.dump({key: float(price) for key, price in prices.items()}, fh, indent=1)
+        fh.write('\n')
+
+
+# header of a price file: magic, number of prices, size of the key blob
+_PRICE_FILE = struct.Struct('<8sQQ')
+_PRICE_FILE_MAGIC = b'TERUPRC1'
+
+
+def write_price_file(path, prices: typing.Mapping[str, float]):
+    """
+    a binary lookup table that can be mapped straight into memory: the header, then n + 1 little-endian uint64 key
+    offsets, n float64 prices, and the UTF-8 keys, sorted by their bytes so that they can be binary searched.
+    """
+    keys = sorted((key.encode(), float(price)) for key, price in prices.items())
+    offsets = array.array('Q', [0])
+    for key, _ in keys:
+        offsets.append(offsets[-1] + len(key))
+
+    values = array.array('d', (price for _, price in keys))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        values.byteswap()
+
+    with open(path, 'wb') as fh:
+        fh.write(_PRICE_FILE.pack(_PRICE_FILE_MAGIC, len(keys), offsets[-1]))
+        fh.write(offsets.tobytes())
+        fh.write(values.tobytes())
+        fh.write(b''.join(key for key, _ in keys))
+
+
+class PriceFile(collections.abc.Mapping):
+    """
+    a read-only mapping over a file from write_price_file(). opening it only maps the file, so it takes the same
+    time however many prices it holds, and each lookup is a binary search over the mapped keys.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count, size = _PRICE_FILE.unpack_from(self._mmap)
+        if magic != _PRICE_FILE_MAGIC:
+            raise ValueError(f'{path} is not a price file')
+
+        view = memoryview(self._mmap)
+        start = _PRICE_FILE.size
+        middle = start + 8 * (self._count + 1)
+        end = middle + 8 * self._count
+        # views into the map rather than copies. casts are native-endian and the file is little-endian, so a
+        # big-endian machine gets byteswapped copies of the two tables instead
+        if sys.byteorder == 'little':
+            self._offsets = view[start:middle].cast('Q')
+            self._prices = view[middle:end].cast('d')
+        else:
+            self._offsets = array.array('Q', bytes(view[start:middle]))
+            self._prices = array.array('d', bytes(view[middle:end]))
+            self._offsets.byteswap()
+            self._prices.byteswap()
+
+        self._keys = view[end:end + size]
+
+    def _key(self, i: int) -> bytes:
+        return bytes(self._keys[self._offsets[i]:self._offsets[i + 1]])
+
+    def __getitem__(self, key: str) -> float:
+        target = key.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < self._count and self._key(lo) == target:
+            return self._prices[lo]
+
+        raise KeyError(key)
+
+    def __iter__(self):
+        return (self._key(i).decode() for i in range(self._count))
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        for view in (self._offsets, self._prices, self._keys):
+            if isinstance(view, memoryview):
+                view.release()
+
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Snapshot(typing.NamedTuple):
+    offset: int  # of the snapshot's ids in the history file
+    timestamp: float
+    label: str
+    count: int
+
+
+# a history file is the magic, then records of a kind and a payload length. NAME records add item names, which are
+# numbered in order across the whole file; SNAP records are one pricing run, as item numbers and prices
+_HISTORY_MAGIC = b'TERUHST1'
+_RECORD = struct.Struct('<4sQ')
+_SNAPSHOT = struct.Struct('<dII')  # timestamp, label length, count
+
+
+class PriceHistory:
+    """
+    an append-only file of price snapshots, stored as columns: uint32 item numbers and float64 prices. opening it
+    only reads the record headers; a snapshot's arrays are read when it's loaded.
+    """
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._scan()
+
+    def _scan(self):
+        """
+        read the record headers. reading stops at the first incomplete record, e.g. from an append that was cut
+        short, and self._end is where the good records end, so the next append() can cut the rest off.
+        """
+        self.names = []
+        self.snapshots = []
+        self._end = 0
+        if not self.path.exists():
+            return
+
+        with self.path.open('rb') as fh:
+            file_size = os.fstat(fh.fileno()).st_size
+            magic = fh.read(len(_HISTORY_MAGIC))
+            if magic != _HISTORY_MAGIC:
+                if len(magic) < len(_HISTORY_MAGIC) and _HISTORY_MAGIC.startswith(magic):
+                    return  # the magic itself was cut short
+
+                raise ValueError(f'{self.path} is not a price history')
+
+            self._end = fh.tell()
+            while len(header := fh.read(_RECORD.size)) == _RECORD.size:
+                kind, size = _RECORD.unpack(header)
+                end = fh.tell() + size
+                if end > file_size:
+                    break
+
+                if kind == b'NAME':
+                    self.names.extend(fh.read(size).decode().split('\0'))
+                elif kind == b'SNAP':
+                    if size < _SNAPSHOT.size:
+                        break
+
+                    timestamp, label_size, count = _SNAPSHOT.unpack(fh.read(_SNAPSHOT.size))
+                    if size != _SNAPSHOT.size + label_size + 12 * count:
+                        break
+
+                    label = fh.read(label_size).decode()
+                    self.snapshots.append(Snapshot(fh.tell(), timestamp, label, count))
+
+                fh.seek(end)
+                self._end = end
+
+    def append(self, prices: typing.Mapping[str, float], label: str = '', timestamp: float = None) -> Snapshot:
+        self._scan()  # in case the file has grown, or been left torn, since it was opened
+        ids = {name: i for i, name in enumerate(self.names)}
+        new = [item for item in prices if item not in ids]
+        for item in new:
+            ids[item] = len(ids)
+
+        numbers = array.array('I', (ids[item] for item in prices))
+        values = array.array('d', map(float, prices.values()))
+        if sys.byteorder != 'little':
+            numbers.byteswap()
+            values.byteswap()
+
+        label_bytes = label.encode()
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.path.open('ab') as fh:
+            if fh.tell() > self._end:
+                fh.truncate(self._end)
+                fh.seek(self._end)
+
+            if self._end == 0:
+                fh.write(_HISTORY_MAGIC)
+
+            if new:
+                names = '\0'.join(new).encode()
+                fh.write(_RECORD.pack(b'NAME', len(names)) + names)
+
+            size = _SNAPSHOT.size + len(label_bytes) + 4 * len(numbers) + 8 * len(values)
+            fh.write(_RECORD.pack(b'SNAP', size) + _SNAPSHOT.pack(timestamp, len(label_bytes), len(numbers)))
+            fh.write(label_bytes)
+            offset = fh.tell()
+            fh.write(numbers.tobytes())
+            fh.write(values.tobytes())
+
+        self.names.extend(new)
+        snapshot = Snapshot(offset, timestamp, label, len(numbers))
+        self.snapshots.append(snapshot)
+        return snapshot
+
+    def load(self, index: int) -> typing.Tuple['np.ndarray', 'np.ndarray']:
+        # (item numbers, prices) of one snapshot; index them into self.names
+        if np is None:
+            raise RuntimeError('reading price history requires numpy')
+
+        snapshot = self.snapshots[index]
+        with self.path.open('rb') as fh:
+            fh.seek(snapshot.offset)
+            ids = np.frombuffer(fh.read(4 * snapshot.count), dtype='<u4')
+            prices = np.frombuffer(fh.read(8 * snapshot.count), dtype='<f8')
+
+        return ids, prices
+
+    def dense(self, index: int) -> 'np.ndarray':
+        # the snapshot's prices by item number, NaN for the items it doesn't have
+        ids, prices = self.load(index)
+        out = np.full(len(self.names), np.nan)
+        out[ids] = prices
+        return out
+
+
+class PriceChange(typing.NamedTuple):
+    item: str
+    old: float
+    new: float
+    change: float
+    relative: float  # change / old, inf when an item moves off a price of 0
+
+
+def diff_snapshots(history: PriceHistory, a: int, b: int, top: int = None, relative: bool = False):
+    """
+    compare two snapshots: [PriceChange, ...] of the items whose price moved, biggest movers first by absolute or
+    relative change, and the items only in a and only in b.
+    """
+    old = history.dense(a)
+    new = history.dense(b)
+    both = ~np.isnan(old) & ~np.isnan(new)
+    change = np.where(both, new - old, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(change != 0, change / np.abs(old), 0.0)
+
+    moved = np.flatnonzero(change)
+    size = np.abs(ratio if relative else change)[moved]
+    moved = moved[np.argsort(-size, kind='stable')][:top]
+    changes = [
+        PriceChange(history.names[i], *values)
+        for i, *values in zip(moved.tolist(), *(column[moved].tolist() for column in (old, new, change, ratio)))
+    ]
+    removed = [history.names[i] for i in np.flatnonzero(~np.isnan(old) & np.isnan(new)).tolist()]
+    added = [history.names[i] for i in np.flatnonzero(np.isnan(old) & ~np.isnan(new)).tolist()]
+    return changes, removed, added
+
+
+EXPORTERS = {
+    '.lua': write_lua,
+    '.csv': write_csv,
+    '.json': write_json,
+    '.prices': write_price_file,
+}
+
+
+def print_price_list(args, catalogue: Catalogue, graph: RecipeGraph):
+    table = price_table(graph, catalogue.price_list, args.markup, args.roundup, args.backend,
+                        policy=catalogue.policy)
+    sys.stdout.write(format_price_table(table))
+
+
+def _number(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _check_request(qty, markup=1.0, round_up=None):
+    # a bad request is an error for its own line, not for the whole stream. a quantity or roundup must be a positive
+    # number, a markup any finite one; bools don't count, though they're ints
+    for name, value, positive in (('quantity', qty, True), ('markup', markup, False), ('roundup', round_up, True)):
+        if value is None and name == 'roundup':
+            continue
+
+        if (isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)
+                or positive and value <= 0):
+            raise ValueError(f'bad {name} {value!r}')
+
+
+def batch_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    """
+    price `item [quantity [roundup]]` requests, one per line, and write each result as soon as it's known. the
+    input is streamed, so memory use doesn't depend on its length.
+    """
+    session = PricingSession(graph, args.markup, args.roundup, catalogue.policy)
+    base = session.base
+    out = args.output
+    for line in args.input:
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+
+        item = fields[0]
+        result = dict(item=item)
+        try:
+            if len(fields) > 3:
+                raise ValueError('expected: item [quantity [roundup]]')
+
+            if len(fields) > 1:
+                result['qty'] = fields[1]  # as written, until it's known to be a good number
+
+            qty = _number(fields[1]) if len(fields) > 1 else 1
+            _check_request(qty)
+            result['qty'] = qty
+            if item not in base:
+                raise KeyError(f'unknown item {item!r}')
+
+            markup, round_up = session.settings(item, qty)
+            if len(fields) > 2:
+                round_up = float(fields[2])
+
+            _check_request(qty, markup, round_up)
+            result['price'] = rounded(base[item] * qty * markup, round_up)
+
+        except (KeyError, ValueError, ArithmeticError) as e:
+            result['error'] = str(e.args[0]) if e.args else type(e).__name__
+
+        if args.format == 'jsonl':
+            out.write(json.dumps(result, allow_nan=False) + '\n')
+        elif 'error' in result:
+            out.write(f'{item}\t{result.get("qty", "")}\terror: {result["error"]}\n')
+        else:
+            out.write(f'{item}\t{result["qty"]}\t{result["price"]}\n')
+
+        if not args.buffered:
+            out.flush()
+
+
+class PriceServer:
+    """
+    answers price queries from a price table kept in memory. clients send one JSON object per line, like
+    `{"item": "tube", "qty": 33, "markup": 0.25, "roundup": 0.25}`, and get one JSON object back per line. SIGHUP
+    reloads the catalogue and reprices it without dropping connections.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.session = None
+        self.reload()
+
+    def reload(self):
+        catalogue = load_catalogue(self.args.catalogue, use_cache=not self.args.no_cache)
+        costs = catalogue.costs(exact=self.args.components == 'exact')
+        if self.args.cheapest:
+            catalogue = catalogue.cheapest(costs)
+
+        graph = catalogue.graph(COMPONENTS[self.args.components], costs, self.args.lazy)
+        # swapped in one go, so a query never sees a half-built table
+        self.session = PricingSession(graph, self.args.markup, self.args.roundup, catalogue.policy)
+        print(f'priced {len(self.session.base)} items from {self.args.catalogue or CATALOGUE_PATH}', file=sys.stderr)
+
+    def answer(self, request: dict) -> dict:
+        item = request['item']
+        qty = request.get('qty', 1)
+        _check_request(qty)
+        base = self.session.base.get(item)
+        if base is None:
+            return dict(item=item, error=f'unknown item {item!r}')
+
+        # the policy's settings, unless the request gives its own
+        markup, round_up = self.session.settings(item, qty)
+        markup = request.get('markup', markup)
+        round_up = request.get('roundup', round_up)
+        _check_request(qty, markup, round_up)
+        return dict(item=item, qty=qty, price=rounded(base * qty * markup, round_up))
+
+    async def handle(self, reader: 'asyncio.StreamReader', writer: 'asyncio.StreamWriter'):
+        try:
+            while line := await reader.readline():
+                try:
+                    response = self.answer(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError, ArithmeticError) as e:
+                    response = dict(error=f'bad request: {e}')
+
+                writer.write(json.dumps(response, allow_nan=False).encode() + b'\n')
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve(self):
+        import asyncio
+
+        if self.args.socket:
+            server = await asyncio.start_unix_server(self.handle, self.args.socket)
+        else:
+            server = await asyncio.start_server(self.handle, self.args.host, self.args.port)
+
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.reload)
+        try:
+            async with server:
+                await server.serve_forever()
+
+        finally:
+            if self.args.socket:
+                self.args.socket.unlink(missing_ok=True)
+
+
+def serve_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    import asyncio
+
+    try:
+        asyncio.run(PriceServer(args).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+class Scenario(typing.NamedTuple):
+    # None means the catalogue's own setting
+    markup: float
+    round_up: float = None
+    cost_scale: float = None
+    crystal_scale: float = None
+    denominator: float = None
+
+    def label(self) -> str:
+        names = dict(markup='m', round_up='r', cost_scale='cost', crystal_scale='crystal', denominator='d')
+        return ' '.join(f'{names[field]}={value}' for field, value in self._asdict().items() if value is not None)
+
+
+_sweep_state = None
+
+
+def _init_sweep_worker(matrix: 'np.ndarray', materials: typing.Tuple[str, ...], cost_spec: dict,
+                       items: typing.List[str] = (), policy: PricingPolicy = None):
+    # runs once per worker, so the material matrix is sent to each process once rather than with every scenario
+    global _sweep_state
+    _sweep_state = matrix, materials, cost_spec, items, PricingPolicy() if policy is None else policy
+
+
+def _price_scenario(scenario: Scenario) -> 'np.ndarray':
+    matrix, materials, cost_spec, items, policy = _sweep_state
+    costs = make_costs(scenario.denominator, scenario.cost_scale, scenario.crystal_scale, spec=cost_spec)
+    vector = np.array([costs[material] for material in materials], dtype=float)
+    markups, round_ups = policy.arrays(items, 1, scenario.markup, scenario.round_up)
+    return apply_price(matrix @ vector, 1, markups, round_ups.astype(float))
+
+
+def sweep_scenarios(matrix: MaterialMatrix, scenarios: typing.Sequence[Scenario], cost_spec: dict,
+                    workers: int = None, policy: PricingPolicy = None) -> 'np.ndarray':
+    """
+    price every item under every scenario, fanned out over a process pool. returns an items x scenarios array.
+    """
+    from concurrent import futures
+
+    chunksize = max(1, len(scenarios) // (4 * (workers or os.cpu_count() or 1)))
+    with futures.ProcessPoolExecutor(
+        workers, initializer=_init_sweep_worker,
+        initargs=(matrix.matrix, matrix.materials, cost_spec, matrix.items, policy),
+    ) as executor:
+        columns = list(executor.map(_price_scenario, scenarios, chunksize=chunksize))
+
+    return np.column_stack(columns)
+
+
+def sweep_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    import csv
+
+    matrix = MaterialMatrix(graph)
+    scenarios = [
+        Scenario(*values)
+        for values in itertools.product(
+            args.markups or [args.markup], args.roundups or [args.roundup],
+            args.cost_scales or [None], args.crystal_scales or [None], args.denominators or [None],
+        )
+    ]
+    table = sweep_scenarios(matrix, scenarios, catalogue.cost_spec, args.workers, catalogue.policy)
+
+    out = csv.writer(args.output, delimiter='\t', lineterminator='\n')
+    out.writerow(['item', *(scenario.label() for scenario in scenarios)])
+    for item, row in zip(matrix.items, table.tolist()):
+        out.writerow([item, *row])
+
+
+def check_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    table = price_table(graph, catalogue.price_list, args.markup, args.roundup, args.backend, args.raw,
+                        catalogue.policy)
+    if args.update:
+        args.golden.write_text(format_price_table(table))
+        print(f'wrote {sum(map(len, table))} prices to {args.golden}')
+        return
+
+    current = [row for section in table for row in section]
+    changes = compare_prices(read_price_table(args.golden), current, args.tolerance, args.relative)
+    for label, old, new in changes:
+        delta = '' if old is None or new is None else f'  ({new - old:+.6g})'
+        print(f'{label:20} {"(missing)" if old is None else old} -> {"(missing)" if new is None else new}{delta}')
+
+    print(f'{len(changes)} of {len(current)} prices changed against {args.golden}')
+    if changes:
+        sys.exit(1)
+
+
+def export_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    for path in args.paths:
+        if path.suffix not in EXPORTERS:
+            sys.exit(f"don't know how to write {path}; use one of {', '.join(EXPORTERS)}")
+
+    prices = {}
+    unmapped = []
+    for item, price in price_items(graph, args.markup, args.roundup, catalogue.policy).items():
+        if not catalogue.has_itemstring(item):
+            unmapped.append(item)
+            if not args.include_unmapped:
+                continue
+
+        key = catalogue.itemstring(item)
+        if key in prices:
+            raise ValueError(f'{item} and another item are both exported as {key}')
+
+        prices[key] = price
+
+    if unmapped:
+        print(f'{len(unmapped)} items have no itemstring in [itemstrings] and were '
+              f'{"exported under their own names" if args.include_unmapped else "skipped"}: '
+              f'{", ".join(unmapped[:10])}{", ..." if len(unmapped) > 10 else ""}', file=sys.stderr)
+
+    for path in args.paths:
+        EXPORTERS[path.suffix](path, prices)
+        print(f'wrote {len(prices)} prices to {path}', file=sys.stderr)
+
+
+def plan_order(args, catalogue: Catalogue, graph: RecipeGraph):
+    order = collections.Counter()
+    for request in args.order:
+        item, _, qty = request.partition('=')
+        try:
+            qty = int(qty or 1)
+        except ValueError:
+            qty = 0
+
+        if qty <= 0:
+            sys.exit(f'bad quantity in {request!r}; expected item[=qty] with a positive qty')
+
+        order[item] += qty
+
+    try:
+        plan = plan_production(graph, order)
+    except KeyError as e:
+        sys.exit(f'unknown item {e.args[0]}')
+    except ValueError as e:
+        sys.exit(str(e))
+
+    print('craft')
+    for item, batches in plan.crafts.items():
+        print(f'    {batches:8} x {item:28} makes {batches * graph.recipes[item].makes}')
+
+    print('buy')
+    for material, qty in plan.bill.items():
+        print(f'    {qty:8}   {material}')
+
+    if plan.leftovers:
+        print('left over')
+        for item, qty in plan.leftovers.items():
+            print(f'    {qty:8}   {item}')
+
+    # marked up as the policy would sell each one, but not rounded
+    policy = catalogue.policy
+    cost = sum(
+        graph.costs[material] * qty * policy.settings(material, qty, args.markup, args.roundup)[0]
+        for material, qty in plan.bill.items()
+    )
+    quoted = sum(
+        graph.price(item, qty, policy.settings(item, qty, args.markup, args.roundup)[0])
+        for item, qty in order.items()
+    )
+    cost, quoted = float(cost), float(quoted)
+    print(f'raw materials {cost:.4f}, against {quoted:.4f} for the items alone')
+
+
+def _describe(history: PriceHistory, index: int) -> str:
+    snapshot = history.snapshots[index]
+    when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.timestamp))
+    label = f'  {snapshot.label}' if snapshot.label else ''
+    return f'{index % len(history.snapshots):6}  {when}  {snapshot.count:6} prices{label}'
+
+
+def record_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    history = PriceHistory(args.history)
+    history.append(price_items(graph, args.markup, args.roundup, catalogue.policy), args.label)
+    print(_describe(history, -1))
+
+
+def list_history(args, catalogue: Catalogue, graph: RecipeGraph):
+    history = PriceHistory(args.history)
+    for index in range(len(history.snapshots)):
+        print(_describe(history, index))
+
+
+def diff_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    history = PriceHistory(args.history)
+    if len(history.snapshots) < 2:
+        sys.exit(f'{args.history} needs at least two snapshots to compare')
+
+    try:
+        changes, removed, added = diff_snapshots(history, args.old, args.new, args.top, args.relative)
+    except IndexError:
+        sys.exit(f'{args.history} has {len(history.snapshots)} snapshots')
+
+    print(_describe(history, args.old))
+    print(_describe(history, args.new))
+    for change in changes:
+        print(f'{change.item:28}{change.old:12.4f} -> {change.new:12.4f}{change.change:+12.4f}{change.relative:+10.1%}')
+
+    for label, items in (('removed', removed), ('added', added)):
+        if items:
+            print(f'{label}: {" ".join(items)}')
+
+
+def material_uses(args, catalogue: Catalogue, graph: RecipeGraph):
+    uses = graph.reverse_index().get(args.material)
+    if uses is None:
+        sys.exit(f'{args.material} is not a raw material')
+
+    print(f'{len(uses)} items contain {args.material}')
+    for item, value in uses[:args.top]:
+        markup, _ = catalogue.policy.settings(item, 1, args.markup, args.roundup)
+        slope = value * markup
+        change = f'{slope * args.change:+12.4f}' if args.change is not None else ''
+        print(f'{item:28}{float(value):12.4f}{float(slope):12.4f}{change}')
+
+
+def print_routes(args, catalogue: Catalogue, graph: RecipeGraph):
+    routes = cheapest_routes(catalogue.recipes, catalogue.alternatives or {}, graph.costs)
+    for item, route in routes.items():
+        markup, _ = catalogue.policy.settings(item, 1, args.markup, args.roundup)
+        costs = [(None, route.raw)] if route.raw is not None else []
+        costs += enumerate(route.costs)
+        costs = '  '.join(f'{"*" if choice == route.choice else " "}{float(cost * markup):.4f}'
+                          for choice, cost in costs)
+        print(f'{item:28}{"buy" if route.choice is None else route.choice:>4}  {costs}')
+
+
+def profile_prices(args, catalogue: Catalogue, graph: RecipeGraph):
+    # rebuilt from the recipes even if the catalogue has compiled bills, so that the expansion is measured too
+    components = COMPONENTS[args.components]
+    profiled = ProfiledRecipeGraph(catalogue.recipes, graph.costs, components)
+    price_table(profiled, catalogue.price_list, args.markup, args.roundup, 'graph', policy=catalogue.policy)
+    sys.stdout.write(profiled.profiler.report(profiled, args.top))
+
+    if args.collapsed:
+        args.collapsed.write_text(profiled.profiler.collapsed())
+
+    if args.pstats:
+        # the plain classes, so the numbers aren't skewed by the instrumentation
+        import cProfile
+        profile = cProfile.Profile()
+        profile.runcall(lambda: price_table(
+            RecipeGraph(catalogue.recipes, graph.costs, components), catalogue.price_list, args.markup, args.roundup,
+            'graph', policy=catalogue.policy,
+        ))
+        profile.dump_stats(args.pstats)
 
 
 def main(args):
-    # crafting recipes
-    # default materials
-    stone = Components(stone=1)
-    cobblestone = stone * 1
-    tree = Components(tree=1)
-    planks = tree / 4
-    stick = planks / 4
-    leaves = tree / 8  # from tubelib grinder
-    water = Components(water=1)
-    flint = Components(flint=1)
-    sand = Components(sand=1)
-    silver_sand = Components(silver_sand=1)
-    glass = sand * 1
-    cotton = Components(cotton=1)
-    wool = cotton * 4
-    string = cotton * 2
-    flower = Components(flower=1)
-    sapling = Components(sapling=1)
-    dye = flower / 4
-    dirt = Components(dirt=1)
-    obsidian = Components(obsidian=1)
-    obsidian_shard = obsidian / 9
-    obsidian_grit = obsidian_shard
-    obsidian_glass = obsidian_shard
-    clay = Components(clay=1)
-    papyrus = leaves * 1
-
-    # metals and other ores
-    wrought_iron_ingot = Components(steel_ingot=1)
-    wrought_iron_block = wrought_iron_ingot * 9
-    gold_ingot = Components(gold_ingot=1)
-    gold_block = gold_ingot * 9
-    copper_ingot = Components(copper_ingot=1)
-    copper_block = copper_ingot * 9
-    tin_ingot = Components(tin_ingot=1)
-    tin_block = tin_ingot * 9
-    terumetal_ingot = Components(terumetal_ingot=1)
-    terumetal_block = terumetal_ingot * 9
-    diamond = Components(diamond=1)
-    diamond_block = diamond * 9
-    mese = Components(mese=1)
-    mese_block = mese * 9
-    mese_fragment = mese / 9
-    silver_ingot = Components(silver_ingot=1)
-    silver_block = silver_ingot * 9
-    mithril_ingot = Components(mithril_ingot=1)
-    mithril_block = mithril_ingot * 9
-    titanium = Components(titanium=1)
-    titanium_block = titanium * 9
-    coal = Components(coal=1)
-    coal_block = coal * 9
-    quartz = Components(quartz=1)
-    quartz_block = quartz * 1
-
-    lead_ingot = Components(lead_ingot=1)
-    lead_block = lead_ingot * 9
-    zinc_ingot = Components(zinc_ingot=1)
-    zinc_block = zinc_ingot * 9
-    uranium_ingot = Components(uranium_ingot=1)
-    uranium_block = uranium_ingot * 9
-    chromium_ingot = Components(chromium_ingot=1)
-    chromium_block = chromium_ingot * 9
-
-    brass_ingot = ((copper_ingot * 2) + zinc_ingot) / 3
-    brass_block = brass_ingot * 9
-    bronze_ingot = ((copper_ingot * 8) + tin_ingot) / 9
-    bronze_block = bronze_ingot * 9
-
-    carbon_steel_ingot = ((wrought_iron_ingot * 3) + coal) / 3
-    carbon_steel_block = carbon_steel_ingot * 9
-    cast_iron_ingot = ((carbon_steel_ingot * 3) + coal) / 3
-    cast_iron_block = cast_iron_ingot * 9
-    stainless_steel_ingot = ((carbon_steel_ingot * 7) + chromium_ingot) / 8
-    stainless_steel_block = stainless_steel_ingot * 9
-
-    # basic craftables
-    bucket = wrought_iron_ingot * 3
-    water_bucket = bucket + water
-    furnace = stone * 8
-    chest = planks * 8
-    torch = (coal + stick) / 4
-
-    tube = (brass_ingot + bronze_ingot + (planks * 3)) / 4
-
-    # "basic materials" mod
-    heating_element = ((copper_ingot * 2) + mese_fragment) / 2
-    silicon = ((sand * 3) + wrought_iron_ingot) / 4
-    simple_ic = ((silicon * 3) + copper_ingot) / 4
-    copper_strip = copper_ingot / 6
-    steel_strip = stainless_steel_ingot / 6
-    chain_link_steel = wrought_iron_ingot / 2
-    chain_steel = (chain_link_steel * 3) / 2
-    chain_link_brass = brass_ingot / 2
-    chain_brass = (chain_link_brass * 3) / 2
-    steel_gear = ((carbon_steel_ingot * 4) + chain_link_steel) / 6
-    oil_extract = leaves * 3
-    steel_bar = cast_iron_ingot / 2
-    parafin = oil_extract
-    plastic = parafin
-    plastic_strip = plastic / 3
-    empty_spool = (plastic * 7) / 3
-    steel_spool = ((empty_spool * 2) + carbon_steel_ingot) / 2
-    copper_spool = ((empty_spool * 2) + copper_ingot) / 2
-    gold_spool = ((empty_spool * 2) + gold_ingot) / 2
-    silver_spool = ((empty_spool * 2) + silver_ingot) / 2
-    padlock = ((wrought_iron_ingot * 2) + steel_bar) / 2
-    energy_crystal = (diamond * 2) + (mese_fragment * 2) + torch + gold_ingot
-    motor = (mese_fragment * 2) + (copper_spool * 2) + (plastic * 2) + bronze_ingot + cast_iron_ingot + steel_gear
-
-    # terumet crystalized things
-    iron_crystal = wrought_iron_ingot
-    gold_crystal = gold_ingot
-    tin_crystal = tin_ingot
-    copper_crystal = copper_ingot
-    terumetal_crystal = terumetal_ingot
-    obsidian_crystal = obsidian
-    diamond_crystal = diamond
-    mese_crystal = mese
-    silver_crystal = silver_ingot
-    mithril_crysal = mithril_ingot
-    zinc_crystal = zinc_ingot
-    lead_crystal = lead_ingot
-    uranium_crystal = uranium_ingot
-    chromium_crystal = chromium_ingot
-
-    flux = terumetal_ingot / 2
-    terusteel_ingot = wrought_iron_ingot + (flux * 2)
-    terucopper_ingot = copper_ingot + flux
-    terucopper_block = terucopper_ingot * 9
-    terutin_ingot = tin_ingot + flux
-    terutin_block = terutin_ingot * 9
-    terugold_ingot = gold_ingot + (flux * 3)
-    coreglass_ingot = diamond + obsidian_shard + (flux * 5)
-    teruchalchum_ingot = (bronze_ingot + (tin_ingot * 2) + (flux * 9)) / 3
-    teruceramic = clay + (flux * 2)
-    teruceramic_block = teruceramic * 9
-    thermese = mese + (flux * 4)
-    thermese_block = thermese * 9
-
-    terumetal_coil = terumetal_ingot
-    terucopper_coil = terucopper_ingot
-    terugold_coil = terugold_ingot
-
-    terumetal_heater = (heating_element * 2) + terumetal_coil
-    thermese_element = ((terucopper_ingot * 2) + thermese) / 2
-    thermese_heater = (thermese_element * 2) + terugold_coil
-    thermese_array = thermese_heater * 6
-
-    biomatter = leaves
-    biomatter_block = biomatter * 9
-    plant_glue = biomatter + water_bucket
-    mulch = tree / 4
-    pressed_wood = (plant_glue + (mulch * 8)) / 16
-
-    # entropic_crystal = diamond_crystal + mul(mese_crystal, 4) + mul(obsidian_crystal, 4)
-    entropic_crystal = diamond_crystal + (mese_crystal * 4) + (obsidian_grit * 4)
-    entropic_matrix = (entropic_crystal * 8) + diamond_block
-    heat_glass = (obsidian_glass + (tin_crystal * 2) + plant_glue + obsidian_grit) / 3
-    heat_unit = obsidian_glass + (terugold_ingot * 2) + mese + (thermese * 2) + terugold_coil + (teruceramic * 2)
-
-    crystal_growth_chamber = water_bucket + (teruchalchum_ingot * 2) + (obsidian_grit * 3) + (obsidian_glass * 3)
-    expansion_press = (stone * 2) + terutin_block + (teruchalchum_ingot * 3) + (terutin_ingot * 3)
-
-    upgrade_base = (terumetal_coil * 3) + (teruceramic * 2) + plant_glue
-    max_heat_upgrade = upgrade_base + (thermese * 3)
-    heat_gen_upgrade = upgrade_base + (thermese_heater * 3)
-    heat_trans_upgrade = upgrade_base + (terugold_coil * 3)
-    external_in_upgrade = upgrade_base + motor + (steel_gear * 2)
-    external_out_upgrade = upgrade_base + (motor * 2) + steel_gear
-    external_io_upgrade = external_in_upgrade + external_out_upgrade + plant_glue + thermese
-    tubelib_upgrade = upgrade_base + (tube * 2) + plant_glue + thermese
-    terumetal_upgrade = upgrade_base + thermese_heater + (crystal_growth_chamber * 2) + (terumetal_crystal * 3)
-    crystal_upgrade = upgrade_base + thermese_array + (energy_crystal * 3) + (entropic_crystal * 3) + crystal_growth_chamber
-    speed_upgrade = upgrade_base + thermese_array + (energy_crystal * 3) + (diamond_crystal * 3)
-
-    terumetal_frame = terumetal_heater + (terumetal_ingot * 8)
-    terusteel_frame = thermese_heater + (terusteel_ingot * 8)
-    coreglass_frame = thermese_array + (coreglass_ingot * 8)
-
-    heatline = ((terugold_coil * 3) + (teruceramic * 6)) / 6
-    heatline_distributor = thermese_block + (terugold_coil * 4) + (teruceramic * 4)
-    thermal_distributor = teruceramic_block + ((terumetal_coil + terucopper_coil) * 4)
-    thermobox = teruceramic_block + ((thermese + terugold_coil) * 4)
-    heat_emitter = coreglass_frame + heat_glass + (terugold_coil * 4) + (teruceramic * 2) + heat_unit
-    heat_reflector = tin_ingot + ((terumetal_ingot + heat_glass) * 4)
-
-    furnace_heater = terumetal_frame + furnace + copper_block + (terucopper_coil * 2) + (teruceramic * 2) + (copper_strip * 2)
-    solar_heater = terusteel_frame + (heat_glass * 3) + (terugold_coil * 2) + (thermese * 2) + water_bucket
-    eee_heater = coreglass_frame + heat_glass + (energy_crystal * 4) + (entropic_crystal * 2) + thermobox
-
-    alloy_smelter = terumetal_frame + (terumetal_coil * 2) + (bucket * 2) + terumetal_heater + (copper_strip * 3)
-    crusher = terumetal_frame + (terucopper_coil * 4) + (steel_strip * 2) + (expansion_press * 2)
-    lava_melter = terumetal_frame + (terutin_ingot * 4) + (terumetal_heater * 4)
-
-    ht_furnace = terusteel_frame + (thermese_heater * 2) + (teruceramic * 5) + copper_strip
-    vulcanizer = terusteel_frame + (terugold_coil * 2) + (thermese * 2) + (teruceramic_block * 2) + crystal_growth_chamber + energy_crystal
-    mese_garden = terusteel_frame + crystal_growth_chamber + (thermese * 2) + (teruceramic * 4) + energy_crystal
-    reformer = terusteel_frame + bucket + (teruceramic * 4) + (terugold_coil * 2) + crystal_growth_chamber
-
-    vacuum_oven = coreglass_frame + (motor * 2) + (teruchalchum_ingot * 2) + (thermese_array * 2) + (teruceramic_block * 2)
-
-    tarball = coal / 4
-    bio_tar = (tarball * 4) + biomatter
-    rubber_bar = bio_tar
-
-    ore_saw = (teruchalchum_ingot * 4) + (terusteel_ingot * 3)
-    advanced_ore_saw = ore_saw + coreglass_ingot + (rubber_bar * 3) + (flux * 6)
-
-    coreglass_pick = (coreglass_ingot * 3) + (stick * 2)
-
-    # terutin_boots = (terutin_ingot * 4)
-    # terutin_helm = (terutin_ingot * 5)
-    # terutin_legs = (terutin_ingot * 7)
-    # terutin_chest = (terutin_ingot * 8)
-
-    rsuit_mat = rubber_bar + coreglass_ingot + teruceramic + (flux * 8)
-    vulcan_boots = rsuit_mat * 4
-    vulcan_helm = rsuit_mat * 5
-    vulcan_legs = rsuit_mat * 7
-    vulcan_chest = rsuit_mat * 8
-
-    bracers = (terumetal_crystal * 5) + (terugold_coil * 4)
-    bracer_base_element = wrought_iron_block / 2
-    antigrav_element = bracer_base_element + entropic_crystal + (flux * 4)
-    antigrav_bracers = bracers + (antigrav_element * 8)
-    aqua_element = bracer_base_element + papyrus + (flux * 4)
-    defense_element = bracer_base_element + rsuit_mat + (flux * 4)
-    fireproof_element = bracer_base_element + obsidian_crystal + (flux * 4)
-    heal_element = bracer_base_element + biomatter_block + (flux * 4)
-    jump_element = bracer_base_element + mese_crystal + (flux * 4)
-    speed_element = bracer_base_element + diamond_crystal + (flux * 4)
-
-    copper_heat_battery = (terumetal_ingot * 6) + (copper_ingot * 3)
-    thermese_heat_battery = (teruceramic * 6) + (thermese * 3)
-    void_battery = (cobblestone * 2) + entropic_crystal
-
-    print("furnace heater      ", cost_of(furnace_heater, args.markup, args.roundup))
-    print("solar heater        ", cost_of(solar_heater, args.markup, args.roundup))
-    print('eee heater          ', cost_of(eee_heater, args.markup, args.roundup))
-    print('entropic_matrix     ', cost_of(entropic_matrix, args.markup, args.roundup))
-    print()
-    print("alloy smelter       ", cost_of(alloy_smelter, args.markup, args.roundup))
-    print("crusher             ", cost_of(crusher, args.markup, args.roundup))
-    print("lava_melter         ", cost_of(lava_melter, args.markup, args.roundup))
-    print()
-    print("ht furnace          ", cost_of(ht_furnace, args.markup, args.roundup))
-    print("vulcanizer          ", cost_of(vulcanizer, args.markup, args.roundup))
-    print("mese garden         ", cost_of(mese_garden, args.markup, args.roundup))
-    print("reformer            ", cost_of(reformer, args.markup, args.roundup))
-    print()
-    print('vacuum_oven         ', cost_of(vacuum_oven, args.markup, args.roundup))
-    print()
-    print("thermal_distributor ", cost_of(thermal_distributor, args.markup, args.roundup))
-    print("thermobox           ", cost_of(thermobox, args.markup, args.roundup))
-    print('heat emitter        ', cost_of(heat_emitter, args.markup, args.roundup))
-    print('heat reflector      ', cost_of(heat_reflector, args.markup, args.roundup))
-    print('11*heatline         ', cost_of(heatline * 11, args.markup, args.roundup))
-    print('heatline_distributor', cost_of(heatline_distributor, args.markup, args.roundup))
-    print()
-    print("crystal_upgrade     ", cost_of(crystal_upgrade, args.markup, args.roundup))
-    print("speed_upgrade       ", cost_of(speed_upgrade, args.markup, args.roundup))
-    print("max_heat_upgrade    ", cost_of(max_heat_upgrade, args.markup, args.roundup))
-    print("heat_gen_upgrade    ", cost_of(heat_gen_upgrade, args.markup, args.roundup))
-    print("heat_trans_upgrade  ", cost_of(heat_trans_upgrade, args.markup, args.roundup))
-    print("external_in_upgrade ", cost_of(external_in_upgrade, args.markup, args.roundup))
-    print("external_out_upgrade", cost_of(external_out_upgrade, args.markup, args.roundup))
-    print('tubelib_upgrade     ', cost_of(tubelib_upgrade, args.markup, args.roundup))
-    print()
-    print('ore saw             ', cost_of(ore_saw, args.markup, args.roundup))
-    print('advanced ore saw    ', cost_of(advanced_ore_saw, args.markup, args.roundup))
-    print('coreglass pick      ', cost_of(coreglass_pick, args.markup, args.roundup))
-    print('vulcan_boots        ', cost_of(vulcan_boots, args.markup, args.roundup))
-    print('vulcan_helm         ', cost_of(vulcan_helm, args.markup, args.roundup))
-    print('vulcan_legs         ', cost_of(vulcan_legs, args.markup, args.roundup))
-    print('vulcan_chest        ', cost_of(vulcan_chest, args.markup, args.roundup))
-    print('antigrav_bracers    ', cost_of(antigrav_bracers, args.markup, args.roundup))
-
-    locked_chest = chest + wrought_iron_ingot
-    iron_chest = locked_chest + (cast_iron_ingot * 8)
-    copper_chest = iron_chest + (copper_ingot * 8)
-    silver_chest = copper_chest + (silver_ingot * 8)
-    gold_chest = silver_chest + (gold_ingot * 8)
-    mithril_chest = gold_chest + (mithril_ingot * 8)
-
-    print()
-    print('iron chest          ', cost_of(iron_chest, args.markup, args.roundup))
-    print('copper chest        ', cost_of(copper_chest, args.markup, args.roundup))
-    print('silver chest        ', cost_of(silver_chest, args.markup, args.roundup))
-    print('gold chest          ', cost_of(gold_chest, args.markup, args.roundup))
-    print('mithril chest       ', cost_of(mithril_chest, args.markup, args.roundup))
-
-    elevator = titanium_block + (glass * 2) + (wrought_iron_ingot * 6)
-    travelnet = (titanium_block * 2) + (mese_block * 3) + (glass * 4)
-
-    print()
-    print('elevator            ', cost_of(elevator, args.markup, args.roundup))
-    print('travelnet           ', cost_of(travelnet, args.markup, args.roundup))
-
-    print()
-    print('99*quartz block     ', cost_of(quartz_block * 99, args.markup, args.roundup))
-
-    wlan_chip = (mese + copper_ingot + gold_ingot + silicon) / 8
-    end_wrench = (stainless_steel_ingot * 3) / 4
-
-    tougher_titanium = titanium * 4
-    titanium_tv = (tougher_titanium * 4) + (wrought_iron_ingot * 4) + glass
-
-    mesecon = mese / 18
-    small_trash_can = ((wrought_iron_ingot * 3) + (steel_spool * 2)) / 3
-
-    sieve = diamond_block + (planks * 6)
-    autosieve = sieve + (diamond_block * 5) + (mese_block * 3)
-
-    pusher = ((planks * 4) + (wool * 2) + (tube * 2) + motor) / 2
-    forceload_block = (planks * 4) + (energy_crystal * 2) + wlan_chip + titanium_tv
-    tubelib_distributor = ((planks * 4) + (tube * 4) + motor) / 2
-    black_hole = ((planks * 4) + coal + small_trash_can + tube) / 2
-    teleporter = ((planks * 2) + (mese_crystal * 2) + (uranium_crystal * 2) + tube)
-    protected_chest = chest + tube + wrought_iron_ingot
-
-    fermenter = (steel_strip * 2) + (tube * 2) + (lead_ingot * 2) + dirt + motor + bucket
-    reformer = (steel_strip * 2) + (tube * 2) + (lead_ingot * 2) + clay + motor + bucket
-    quarry = (planks * 4) + (mese * 7) + tube + (stick * 6)
-    fast_pusher = pusher * 3
-    liquid_sampler = (planks * 4) + (lead_ingot * 2) + motor + tube + bucket
-    harvester = (planks * 4) + (mese * 5) + (silver_ingot * 2) + tube + motor + (stick * 5)
-    grinder = (planks * 4) + (tube * 2) + motor + steel_gear + lead_block
-    funnel = protected_chest + bucket
-    autocrafter = (planks * 2) + (tube * 2) + (wrought_iron_ingot * 2) + motor + simple_ic + steel_gear
-    biogas = leaves * 2
-    biofuel = biogas * 4
-
-    repair_kit = steel_gear + end_wrench + oil_extract
-
-    hp_pusher = (fast_pusher * 2) + brass_ingot + terugold_ingot
-    hp_distributor = (tubelib_distributor * 2) + brass_ingot + terugold_ingot
-    hp_chest = (protected_chest * 2) + brass_ingot + terugold_ingot
-    hp_pushing_chest = hp_pusher + hp_chest + brass_ingot + terugold_ingot
-    hp_funnel = (funnel * 2) + brass_ingot + terugold_ingot
-
-    tubelib_lamp = ((plastic * 3) + (planks * 2) + wlan_chip + mese_fragment) / 4
-    tubelib_streetlamp = (tubelib_lamp + glass + wrought_iron_ingot) / 2
-    tubelib_ceilinglamp = (tubelib_lamp + planks + glass) / 3
-    invisible_lamp = tubelib_lamp + obsidian_glass
-    industrial_lamp = ((plastic_strip * 2) + glass + wlan_chip + dye + copper_ingot)
-    industrial_lamp2 = ((glass * 2) + (steel_bar * 2) + wlan_chip + dye)
-
-    tubelib_button = (planks * 2) + glass + wlan_chip
-    tubelib_timer = (planks * 4) + wlan_chip + quartz
-    tubelib_sequencer = (planks * 4) + simple_ic + wlan_chip
-    tubelib_repeater = (planks * 2) + (wlan_chip * 2)
-    tubelib_programmer = wrought_iron_ingot + wlan_chip + dye
-    tubelib_msecons_converter = tubelib_button + mesecon
-    tubelib_not = (planks * 2) + (wlan_chip * 2)
-    tubelib_door = planks + wlan_chip
-    tubelib_gate = planks + wlan_chip
-    access_control = wrought_iron_block + wlan_chip
-    tubelib_detector = (planks * 2) + (tube * 2) + wlan_chip
-
-
-    print()
-    print('tube * 33           ', cost_of(tube * 33, args.markup, .25))
-    print('teleporter          ', cost_of(teleporter, args.markup, .25))
-    print('black_hole          ', cost_of(black_hole, args.markup, .25))
-    print('funnel              ', cost_of(funnel, args.markup, .25))
-    print('biofuel * 99        ', cost_of(biofuel * 99, args.markup, .25))
-    print('repair_kit * 11     ', cost_of(repair_kit * 11, args.markup, .25))
-
-    print('pusher              ', cost_of(pusher, args.markup, .25))
-    print('fast pusher         ', cost_of(fast_pusher, args.markup, .25))
-    print('HP pusher           ', cost_of(hp_pusher, args.markup, .25))
-    print('HP pushing chest    ', cost_of(hp_pushing_chest, args.markup, .25))
-
-    print('distributor         ', cost_of(tubelib_distributor, args.markup, .25))
-    print('HP distributor      ', cost_of(hp_distributor, args.markup, .25))
-
-    print('protected chest     ', cost_of(protected_chest, args.markup, .25))
-    print('HP chest            ', cost_of(hp_chest, args.markup, .25))
-
-    print('autocrafter         ', cost_of(autocrafter, args.markup, .25))
-    print('quarry              ', cost_of(quarry, args.markup, .25))
-    print('harvester           ', cost_of(harvester, args.markup, .25))
-    print('liquid sampler      ', cost_of(liquid_sampler, args.markup, .25))
-
-    print('fermenter           ', cost_of(fermenter, args.markup, .25))
-    print('reformer            ', cost_of(reformer, args.markup, .25))
-    print('grinder             ', cost_of(grinder, args.markup, .25))
-    print('autosieve           ', cost_of(autosieve, args.markup, args.roundup))
-
-    print('forceload_block     ', cost_of(forceload_block, args.markup, args.roundup))
-
-    print('tubelib_lamp        ', cost_of(tubelib_lamp, args.markup, .25))
-    print('tubelib_streetlamp  ', cost_of(tubelib_streetlamp, args.markup, .25))
-    print('tubelib_ceilinglamp ', cost_of(tubelib_ceilinglamp, args.markup, .25))
-    print('invisible_lamp      ', cost_of(invisible_lamp, args.markup, .25))
-    print('industrial_lamp     ', cost_of(industrial_lamp, args.markup, .25))
-    print('industrial_lamp2    ', cost_of(industrial_lamp2, args.markup, .25))
-
-    print('tubelib_button      ', cost_of(tubelib_button, args.markup, .25))
-    print('access_control      ', cost_of(access_control, args.markup, .25))
-    print('tubelib_detector    ', cost_of(tubelib_detector, args.markup, .25))
-    print('tubelib_timer       ', cost_of(tubelib_timer, args.markup, .25))
-    print('tubelib_sequencer   ', cost_of(tubelib_sequencer, args.markup, .251))
-    print('tubelib_repeater    ', cost_of(tubelib_repeater, args.markup, .25))
-    print('tubelib_programmer  ', cost_of(tubelib_programmer, args.markup, .25))
-    print('msecons_converter   ', cost_of(tubelib_msecons_converter, args.markup, .25))
-    print('tubelib_not         ', cost_of(tubelib_not, args.markup, .25))
-    print('tubelib_door * 6    ', cost_of(tubelib_door * 6, args.markup, .25))
-    print('tubelib_gate * 6    ', cost_of(tubelib_gate * 6, args.markup, .25))
-
-    small_bag = (wool * 6) + cotton
-    medium_bag =(small_bag * 2) + (cotton * 2)
-    large_bag = (medium_bag * 2) + (cotton * 2)
-
-    print()
-    print('small bag           ', cost_of(small_bag, args.markup, 1))
-    print('medium bag          ', cost_of(medium_bag, args.markup, 1))
-    print('large bag           ', cost_of(large_bag, args.markup, 1))
-    print('protection block    ', cost_of(wrought_iron_ingot * 10, args.markup, 1))
-
-    glue = sapling / 2
-    fiber = glue / 6
-    insulated_mesecon = mesecon + (fiber * 2)
-    digiline = ((insulated_mesecon * 2) + (fiber * 6) + gold_ingot) / 2
-
-    luacontroller = ((silicon * 4) + (mesecon * 4)) / 2
-    microcontroller = luacontroller
-    player_detector = (wrought_iron_ingot * 7) + microcontroller + microcontroller
-    mesecon_button = (mesecon + stone) / 2
-    digiline_button = (mesecon_button + luacontroller + digiline)
-    lightstone = (dye * 3) + torch + mesecon
-    digiline_lcd = ((glass * 3) + (lightstone * 3) + (wrought_iron_ingot * 2) + digiline)
-
-    print()
-    print('mesecon * 22        ', cost_of(mesecon * 22, args.markup, .25))
-    print('insulated_mesecon*11', cost_of(insulated_mesecon * 11, args.markup, .25))
-    print('digiline * 11       ', cost_of(digiline * 11, args.markup, .25))
-    print('luacontroller       ', cost_of(luacontroller, args.markup, .25))
-    print('player_detector     ', cost_of(player_detector, args.markup, .25))
-    print('mesecon_button      ', cost_of(mesecon_button, args.markup, .25))
-    print('digiline_button     ', cost_of(digiline_button, args.markup, .25))
-    print('digiline_lcd        ', cost_of(digiline_lcd, args.markup, .25))
-
-    print()
-    print('gold ingot * 99     ', cost_of(gold_ingot * 99, args.markup, 1))
-    print('silver ingot * 99   ', cost_of(silver_ingot * 99, args.markup, 1))
-    print('tin ingot * 99      ', cost_of(tin_ingot * 99, args.markup, 1))
-    print('mese * 99           ', cost_of(mese * 99, args.markup, 1))
-    print('steel block * 99    ', cost_of(wrought_iron_block * 99, args.markup, 1))
-    print('titanium block * 6  ', cost_of(titanium_block * 6, args.markup, 1))
-
-    tougher_titanium = titanium * 4
-    titanium_plate = (titanium * 8 + tougher_titanium) / 9
-    titanium_glass = (titanium * 4 + glass) / 3
-    terumet_glass = ((glass * 4) + silver_sand + flux) / 4
-    terumet_glow_glass = ((terumet_glass * 4) + mese + flux) / 4
-    thermese_battery = (teruceramic * 6) + (thermese * 3)
-    goggles = (titanium_plate * 5) + (titanium_glass * 2) + terumet_glow_glass + thermese_battery
-
-    print()
-    print('night vision goggles', cost_of(goggles, args.markup, 1))
-
-    buy_at = 1/5
-    # print()
-    # print('buy steel ingot * 99      ', cost_of(wrought_iron_ingot * 99, args.markup * buy_at, .1))
-    # print('buy diamond ore * 10      ', cost_of(diamond * 10 * 4, args.markup * buy_at, args.roundup))
-    # print('buy iron lump * 99      ', cost_of(wrought_iron_ingot * 99 * 3, args.markup * buy_at, args.roundup))
-    # print('buy copper lump * 99    ', cost_of(copper_ingot * 99 * 3, args.markup * buy_at, args.roundup))
-    # print('buy tin lump * 99       ', cost_of(tin_ingot * 99 * 3, args.markup * buy_at, args.roundup))
-    # print('buy gold lump * 99      ', cost_of(gold_ingot * 99 * 3, args.markup * buy_at, args.roundup))
-    # print('buy terumetal lump * 99 ', cost_of(terumetal_ingot * 99 * 3, args.markup * buy_at, args.roundup))
-    # print('buy silver lump * 99    ', cost_of(silver_ingot * 99 * 3, args.markup * buy_at, args.roundup))
-    # print('buy mithril lump * 99   ', cost_of(mithril_ingot * 99 * 3, args.markup * buy_at, args.roundup))
+    if args.cache_size is not None:
+        set_frozen_cache_size(args.cache_size)
+
+    catalogue = open_catalogue(args)
+    costs = catalogue.costs(exact=args.components == 'exact')
+    if args.cheapest:
+        catalogue = catalogue.cheapest(costs)
+
+    graph = catalogue.graph(COMPONENTS[args.components], costs, args.lazy)
+
+    args.command(args, catalogue, graph)
+
+    if args.components == 'frozen':
+        print('frozen components cache:', frozen_cache_info(), file=sys.stderr)
 
 
 def parse_args(argv=None, namespace=None):
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--markup', '-m', type=float, default=(1/4), help='default: %(default)s')
     parser.add_argument('--roundup', '-r', type=float, default=1, help='default: %(default)s')
+    parser.add_argument('--backend', choices=('auto', 'graph', 'numpy'), default='auto',
+                        help='auto is numpy unless it is missing or --components is exact; default: %(default)s')
+    parser.add_argument('--components', choices=tuple(COMPONENTS), default='counter', help='default: %(default)s')
+    parser.add_argument('--catalogue', '-c', type=pathlib.Path, help=f'default: {CATALOGUE_PATH.name}')
+    parser.add_argument('--cheapest', action='store_true', help='make items with several recipes the cheapest way')
+    parser.add_argument('--lazy', action='store_true', help='only expand the recipes that are actually priced')
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write the compiled catalogue cache")
+    parser.add_argument('--cache-size', type=int, help='LRU size for --components frozen; default: 4096')
+    parser.set_defaults(command=print_price_list)
+    commands = parser.add_subparsers(title='commands', description='default: print the price list')
+
+    batch = commands.add_parser('batch', help='price `item [quantity [roundup]]` lines from a file or stdin')
+    batch.add_argument('input', nargs='?', type=argparse.FileType('r'), default='-', help='default: stdin')
+    batch.add_argument('--output', '-o', type=argparse.FileType('w'), default='-', help='default: stdout')
+    batch.add_argument('--format', '-f', choices=('tsv', 'jsonl'), default='tsv', help='default: %(default)s')
+    batch.add_argument('--buffered', action='store_true', help="don't flush after every line")
+    batch.set_defaults(command=batch_prices)
+
+    serve = commands.add_parser('serve', help='answer JSON-lines price queries over a socket; SIGHUP reloads')
+    serve.add_argument('--socket', '-s', type=pathlib.Path, help='listen on this unix socket instead of TCP')
+    serve.add_argument('--host', default='127.0.0.1', help='default: %(default)s')
+    serve.add_argument('--port', '-p', type=int, default=8347, help='default: %(default)s')
+    serve.set_defaults(command=serve_prices)
+
+    sweep = commands.add_parser('sweep', help='price the catalogue under every combination of the given settings')
+    sweep.add_argument('--markups', type=float, nargs='+', help='default: --markup')
+    sweep.add_argument('--roundups', type=float, nargs='+', help='default: --roundup')
+    sweep.add_argument('--cost-scales', type=float, nargs='+', help='default: from the catalogue')
+    sweep.add_argument('--crystal-scales', type=float, nargs='+', help='default: from the catalogue')
+    sweep.add_argument('--denominators', type=float, nargs='+', help='default: from the catalogue')
+    sweep.add_argument('--workers', '-j', type=int, help='default: one per cpu')
+    sweep.add_argument('--output', '-o', type=argparse.FileType('w'), default='-', help='default: stdout')
+    sweep.set_defaults(command=sweep_prices)
+
+    check = commands.add_parser('check', help='compare the price list with a golden table, without printing it')
+    check.add_argument('golden', nargs='?', type=pathlib.Path, default=GOLDEN_PATH,
+                       help=f'default: {GOLDEN_PATH.name}')
+    check.add_argument('--tolerance', '-t', type=float, default=0.0, help='default: %(default)s')
+    check.add_argument('--relative', action='store_true', help='the tolerance is a fraction of the golden price')
+    check.add_argument('--raw', action='store_true', help='compare unrounded prices')
+    check.add_argument('--update', action='store_true', help='write the current prices to the golden table')
+    check.set_defaults(command=check_prices)
+
+    export = commands.add_parser('export', help="write every item's price for the in-game shop")
+    export.add_argument('paths', nargs='+', type=pathlib.Path,
+                        help=f'the format is picked by the extension: {", ".join(EXPORTERS)}')
+    export.add_argument('--include-unmapped', action='store_true',
+                        help='export items with no itemstring under their own names, rather than leaving them out')
+    export.set_defaults(command=export_prices)
+
+    plan = commands.add_parser('plan', help='what to buy and craft, in whole batches, to make an order')
+    plan.add_argument('order', nargs='+', metavar='item[=qty]')
+    plan.set_defaults(command=plan_order)
+
+    history = argparse.ArgumentParser(add_help=False)
+    history.add_argument('--history', type=pathlib.Path, default=HISTORY_PATH, help=f'default: {HISTORY_PATH.name}')
+
+    record = commands.add_parser('record', parents=[history], help='append every price to the price history')
+    record.add_argument('--label', '-l', default='', help='e.g. what changed')
+    record.set_defaults(command=record_prices)
+
+    snapshots = commands.add_parser('history', parents=[history], help='list the snapshots in the price history')
+    snapshots.set_defaults(command=list_history)
+
+    diff = commands.add_parser('diff', parents=[history], help='what moved between two snapshots of the price history')
+    diff.add_argument('old', nargs='?', type=int, default=-2,
+                      help='snapshot number, negative from the end; default: %(default)s')
+    diff.add_argument('new', nargs='?', type=int, default=-1, help='default: %(default)s')
+    diff.add_argument('--top', '-n', type=int, default=20, help='default: %(default)s')
+    diff.add_argument('--relative', action='store_true', help='rank by relative rather than absolute change')
+    diff.set_defaults(command=diff_prices)
+
+    uses = commands.add_parser('uses',
+                               help='which items contain a raw material, and how much their prices depend on it')
+    uses.add_argument('material')
+    uses.add_argument('--top', '-n', type=int, help='only the n most affected items')
+    uses.add_argument('--change', type=float, help='also show how much each price moves if the material moves by this')
+    uses.set_defaults(command=material_uses)
+
+    routes = commands.add_parser('routes', help='which recipe is cheapest for items that have more than one')
+    routes.set_defaults(command=print_routes)
+
+    profile = commands.add_parser('profile', help='count and time the work done per item while pricing the price list')
+    profile.add_argument('--top', '-n', type=int, default=20, help='rows in the report; default: %(default)s')
+    profile.add_argument('--collapsed', type=pathlib.Path, help='write collapsed stacks for flamegraph.pl here')
+    profile.add_argument('--pstats', type=pathlib.Path, help='write cProfile stats of an uninstrumented run here')
+    profile.set_defaults(command=profile_prices)
+
     return parser.parse_args(argv, namespace)
 
 